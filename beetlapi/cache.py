@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+_missing = object()
+
+
+class LRUCache:
+
+    # bounded, least recently used entries go first, entries older than
+    # `ttl` seconds count as missing. handlers run on several threads,
+    # hence the lock.
+    #
+    # `maxsize` is in whatever `weigh` returns per value, entries by
+    # default. with weigh=len and bytes values it's a memory budget.
+    #
+    # a reader that loaded a value before some writer invalidated it must
+    # not put it back afterwards: take `generation` before loading and pass
+    # it to `set`, which then skips values loaded before any invalidation.
+
+    def __init__(self, maxsize: int, ttl: float, weigh=None):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigh = weigh or (lambda value: 1)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def _pop(self, key):
+
+        # the lock is held by the caller
+        _, _, weight = self._data.pop(key)
+        self.size -= weight
+
+    def get(self, key, default=None):
+
+        with self._lock:
+            expires, value, _ = self._data.get(key, (0, _missing, 0))
+
+            if value is _missing or expires < time.monotonic():
+                if value is not _missing:
+                    self._pop(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+
+        weight = self.weigh(value)
+        if weight > self.maxsize:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, weight)
+            self.size += weight
+            while self.size > self.maxsize:
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+
+        with self._lock:
+            self.generation += 1
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,107 @@
+from beetlapi.database.main import Beetl, Bid, BeetlAggregate
+from datetime import datetime
+from sqlalchemy import func, insert as core_insert
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, delete, select
+from typing import List, Optional, Tuple
+
+# Per beetl count and sums of the bids, so totals and coverage don't need
+# to scan the bids. Every bid write calls `track_bid` within its own
+# transaction, `rebuild_aggregates` recreates everything from the bids:
+#
+#     python -m beetlapi.database.repair
+
+BidValues = Tuple[int, int, int]
+
+
+def bid_values(bid: Bid) -> BidValues:
+    return (bid.min, bid.min if bid.mid is None else bid.mid, bid.max)
+
+
+def track_bid(
+        session: Session,
+        obfuscation: str,
+        slug: str,
+        before: Optional[BidValues] = None,
+        after: Optional[BidValues] = None,
+    ):
+
+    # before / after are the bid_values of the bid, None when it did not /
+    # does not exist anymore
+    count = (after is not None) - (before is not None)
+    before, after = before or (0, 0, 0), after or (0, 0, 0)
+    _update(session, obfuscation, slug, count, *(a - b for a, b in zip(after, before)))
+
+
+def track_new_bids(session: Session, obfuscation: str, slug: str, values: List[BidValues]):
+
+    sums = [sum(column) for column in zip(*values)] or [0, 0, 0]
+    _update(session, obfuscation, slug, len(values), *sums)
+
+
+def _update(session: Session, obfuscation: str, slug: str, count: int, sum_min: int, sum_mid: int, sum_max: int):
+
+    statement = insert(BeetlAggregate).values(
+        beetl_obfuscation=obfuscation,
+        beetl_slug=slug,
+        bids_count=count,
+        sum_min=sum_min,
+        sum_mid=sum_mid,
+        sum_max=sum_max,
+        updated=datetime.utcnow(),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['beetl_obfuscation', 'beetl_slug'],
+        set_={
+            'bids_count': BeetlAggregate.bids_count + statement.excluded.bids_count,
+            'sum_min': BeetlAggregate.sum_min + statement.excluded.sum_min,
+            'sum_mid': BeetlAggregate.sum_mid + statement.excluded.sum_mid,
+            'sum_max': BeetlAggregate.sum_max + statement.excluded.sum_max,
+            'updated': statement.excluded.updated,
+        },
+    )
+    session.exec(statement)
+
+
+def get_aggregate(session: Session, obfuscation: str, slug: str) -> BeetlAggregate:
+
+    aggregate = session.get(BeetlAggregate, (obfuscation, slug))
+    if aggregate is None:
+        # no bid was ever written
+        return BeetlAggregate(
+            beetl_obfuscation=obfuscation,
+            beetl_slug=slug,
+            updated=datetime.min,
+        )
+    return aggregate
+
+
+def delete_aggregate(session: Session, obfuscation: str, slug: str):
+
+    session.exec(
+        delete(BeetlAggregate)
+        .where(BeetlAggregate.beetl_obfuscation == obfuscation)
+        .where(BeetlAggregate.beetl_slug == slug)
+    )
+
+
+def rebuild_aggregates(connection) -> int:
+
+    table = BeetlAggregate.__table__
+    connection.execute(table.delete())
+    result = connection.execute(
+        core_insert(table).from_select(
+            ['beetl_obfuscation', 'beetl_slug', 'bids_count', 'sum_min', 'sum_mid', 'sum_max', 'updated'],
+            select(
+                Beetl.obfuscation,
+                Beetl.slug,
+                func.count(),
+                func.sum(Bid.min),
+                func.sum(func.coalesce(Bid.mid, Bid.min)),
+                func.sum(Bid.max),
+                func.max(Bid.updated),
+            ).join(Beetl, Beetl.key == Bid.beetl_key).group_by(Bid.beetl_key),
+        )
+    )
+    return result.rowcount
+
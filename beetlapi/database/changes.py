@@ -0,0 +1,105 @@
+from beetlapi.database.main import BeetlChange
+from collections import deque
+from sqlalchemy import delete, insert
+from typing import Iterable, Optional, Set, Tuple
+import time
+
+# Every worker caches beetls and /bids responses (see main.py) and drops
+# an entry when it writes to that beetl itself. Writes of the other
+# workers go through the beetlchange table: whoever writes to a beetl
+# appends its (obfuscation, slug) in the same transaction, and every worker
+# follows that log with a ChangeFeed per shard.
+#
+# A poll asks its connection for `PRAGMA data_version`, which only changes
+# when another connection committed to the file, and reads the rows after
+# the last one seen only then. An idle poll doesn't touch a single page. A
+# write is evicted everywhere within one poll interval.
+#
+# Rows are pruned once every feed saw them, that is `keep` seconds after
+# some feed saw them. A feed that didn't poll for longer than that may have
+# missed some and answers None: drop everything.
+
+Key = Tuple[str, str]
+
+keep = 600
+
+
+def record_changes(session, keys: Iterable[Key]):
+
+    # session or connection of the write, keys are (obfuscation, slug)
+    rows = [{'obfuscation': obfuscation, 'slug': slug} for obfuscation, slug in set(keys)]
+    if rows:
+        session.execute(insert(BeetlChange), rows)
+
+
+class ChangeFeed:
+
+    def __init__(self, engine):
+
+        # a read-only engine, the feed keeps one of its connections
+        self.engine = engine
+        self._connection = None
+        self._data_version = None
+        self._last_id = 0
+        self._polled = 0
+        # (when, last id) for pruning
+        self._seen = deque()
+        self._pruned = time.monotonic()
+
+    def _query(self, sql: str, *parameters) -> list:
+
+        cursor = self._connection.cursor()
+        try:
+            return cursor.execute(sql, parameters).fetchall()
+        finally:
+            cursor.close()
+
+    def poll(self) -> Optional[Set[Key]]:
+
+        # the keys written to by others since the last poll, None for all
+        now = time.monotonic()
+        if self._connection is None:
+            # what was written before has never been cached here
+            self._connection = self.engine.raw_connection()
+            self._data_version = self._query("PRAGMA data_version")[0][0]
+            self._last_id = self._query("SELECT coalesce(max(id), 0) FROM beetlchange")[0][0]
+            self._polled = now
+            return set()
+
+        missed = now - self._polled > keep
+        self._polled = now
+        data_version = self._query("PRAGMA data_version")[0][0]
+        if data_version == self._data_version and not missed:
+            return set()
+
+        self._data_version = data_version
+        rows = self._query(
+            "SELECT id, obfuscation, slug FROM beetlchange WHERE id > ? ORDER BY id",
+            self._last_id,
+        )
+        if rows:
+            self._last_id = rows[-1][0]
+            self._seen.append((now, self._last_id))
+
+        return None if missed else {(obfuscation, slug) for _, obfuscation, slug in rows}
+
+    def prune(self, engine, interval: float = 60):
+
+        # deletes with the writer `engine`, at most every `interval` seconds
+        now = time.monotonic()
+        if now - self._pruned < interval:
+            return
+        self._pruned = now
+
+        last_id = None
+        while self._seen and now - self._seen[0][0] > keep:
+            last_id = self._seen.popleft()[1]
+        if last_id is not None:
+            with engine.begin() as connection:
+                connection.execute(delete(BeetlChange).where(BeetlChange.id <= last_id))
+
+    def close(self):
+
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
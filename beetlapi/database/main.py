@@ -1,46 +1,177 @@
 from typing import Optional
-from sqlmodel import SQLModel, create_engine, Field, Session, delete, select
-from datetime import datetime, timedelta
+from sqlmodel import SQLModel, create_engine, Field
+from sqlalchemy import Column, Index, event
+from sqlalchemy.pool import QueuePool
+from datetime import datetime
 from beetlapi.database.models import *
+from beetlapi.database.migrations import migrate
+from beetlapi.database.types import EpochMicroseconds, UUIDBlob
 import uuid as uuid_pkg
+from urllib.parse import quote
 import secrets
 import os
+import zlib
 sqlite_file_name = "database.db"
 
 if os.environ.get('DEVDEVDEV'):
     sqlite_file_name = "/dev/shm/beetldatabase.sqlite"
 
+sqlite_file_name = os.environ.get('BEETL_DATABASE', sqlite_file_name)
 
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+# with BEETL_SHARDS > 1 the beetls are spread over that many files by the
+# hash of their obfuscation, each with its own engine and write lock. shard
+# 0 stays in sqlite_file_name, the others go next to it as database.1.db,
+# database.2.db, ... `python -m beetlapi.database.repair rebalance` moves
+# existing data to where it belongs after the count changed.
+shard_count = int(os.environ.get('BEETL_SHARDS', 1))
 
 connect_args = {"check_same_thread": False}
 
-engine = create_engine(sqlite_url, echo=False, connect_args=connect_args)
+# every shard has two engines: the writer, a single connection all writes
+# queue up for instead of fighting over sqlite's lock, and a pool of
+# read-only connections (mode=ro), which under WAL read alongside it.
+# handlers run on the threadpool, so every thread in flight may hold a
+# reader. keep the read pool roughly as big as the threadpool.
+pool_size = int(os.environ.get('BEETL_DB_POOL_SIZE', 8))
+max_overflow = int(os.environ.get('BEETL_DB_MAX_OVERFLOW', 8))
+
+
+def shard_file_name(shard: int) -> str:
+
+    if shard == 0:
+        return sqlite_file_name
+    root, extension = os.path.splitext(sqlite_file_name)
+    return f"{root}.{shard}{extension}"
+
+
+def shard_of(obfuscation: str, count: int = None) -> int:
+    # crc32 instead of hash(), which differs between processes
+    return zlib.crc32(obfuscation.encode()) % (count or shard_count)
+
+
+def create_shard_engine(file_name: str, read_only: bool = False):
+
+    if read_only:
+        path = quote(os.path.abspath(file_name))
+        shard_engine = create_engine(
+            f"sqlite:///file:{path}?mode=ro&uri=true",
+            echo=False,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
+        event.listen(shard_engine, "connect", _apply_reader_pragmas)
+        return shard_engine
+
+    shard_engine = create_engine(
+        f"sqlite:///{file_name}",
+        echo=False,
+        connect_args=connect_args,
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    event.listen(shard_engine, "connect", _apply_pragmas)
+    return shard_engine
 
+# applied on every new connection. WAL lets readers carry on while someone
+# writes, with synchronous=NORMAL only checkpoints fsync, not every commit.
+# auto_vacuum has to come before WAL and only takes effect on a fresh
+# database, `python -m beetlapi.database.repair vacuum` converts old ones.
+sqlite_pragmas = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': os.environ.get('BEETL_SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('BEETL_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('BEETL_SQLITE_CACHE_SIZE', -64000)),
+    'mmap_size': int(os.environ.get('BEETL_SQLITE_MMAP_SIZE', 268435456)),
+    'busy_timeout': int(os.environ.get('BEETL_SQLITE_BUSY_TIMEOUT', 5000)),
+    'temp_store': os.environ.get('BEETL_SQLITE_TEMP_STORE', 'MEMORY'),
+}
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+_pragma_choices = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA', '0', '1', '2', '3'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY', '0', '1', '2'},
+}
+
+for pragma, choices in _pragma_choices.items():
+    sqlite_pragmas[pragma] = sqlite_pragmas[pragma].upper()
+    if sqlite_pragmas[pragma] not in choices:
+        raise ValueError(f"invalid sqlite {pragma}: {sqlite_pragmas[pragma]}")
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+
+    cursor = dbapi_connection.cursor()
+    for pragma, value in sqlite_pragmas.items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+# the ones that change the file are the writer's business
+_reader_pragmas = ['cache_size', 'mmap_size', 'busy_timeout', 'temp_store']
+
+
+def _apply_reader_pragmas(dbapi_connection, connection_record):
+
+    cursor = dbapi_connection.cursor()
+    for pragma in _reader_pragmas:
+        cursor.execute(f"PRAGMA {pragma} = {sqlite_pragmas[pragma]}")
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def incremental_vacuum(engine):
+
+    # hands the free pages back to the file system. every step of the
+    # pragma frees one page, executescript runs it to the end.
+    with engine.connect() as connection:
+        connection.connection.executescript("PRAGMA incremental_vacuum")
+
+
+engines = [create_shard_engine(shard_file_name(shard)) for shard in range(shard_count)]
+read_engines = [create_shard_engine(shard_file_name(shard), read_only=True) for shard in range(shard_count)]
+
+# the writer, the only one without sharding. things not about one beetl in
+# particular have to go through all of `engines`.
+engine = engines[0]
+
+
+def engine_for(obfuscation: str, read_only: bool = False):
+    shard = shard_of(obfuscation, len(engines))
+    return read_engines[shard] if read_only else engines[shard]
 
-def delete_entries(table: SQLModel, time_ago: timedelta):
 
-    kill_date = datetime.now() - time_ago
+def all_engines(read_only: bool = False) -> list:
+    return read_engines if read_only else engines
 
-    with Session(engine) as session:
 
-        statement = select(table).where(table.updated <= kill_date)
-        old_entries = session.exec(statement).all()
+def create_db_and_tables():
+    for shard_engine in engines:
+        SQLModel.metadata.create_all(shard_engine)
+        migrate(shard_engine)
+
 
-        for entry in old_entries:
-            session.delete(entry)
+def _timestamp():
+    return Field(default_factory=datetime.utcnow, sa_column=Column(EpochMicroseconds, nullable=False))
 
 
 class Beetl(SQLModel, table=True):
 
+    # autoincrement: a deleted beetl's key is never handed out again, bids
+    # that still refer to it can't turn up under another beetl
+    __table_args__ = (
+        Index("ix_beetl_obfuscation_slug", "obfuscation", "slug", unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
+    # the rowid, what bids refer to. it's local to the shard's file and
+    # never leaves the api, ids do.
+    key: Optional[int] = Field(default=None, primary_key=True)
     id: uuid_pkg.UUID = Field(
         default_factory=uuid_pkg.uuid4,
-        primary_key=True,
-        index=True,
-        nullable=False,
+        sa_column=Column(UUIDBlob, unique=True, nullable=False),
     )
     secretkey: str = Field(
         default_factory=secrets.token_urlsafe,
@@ -51,22 +182,33 @@ class Beetl(SQLModel, table=True):
     title: Optional[str]
     description: Optional[str]
     target: Optional[int]
-    created: datetime = Field(default_factory=datetime.utcnow)
-    updated: datetime = Field(default_factory=datetime.utcnow)
+    created: datetime = _timestamp()
+    updated: datetime = _timestamp()
     method: str
     beetlmode: str
 
     # shall not be updated by user
-    _ignore_fields = ["obfuscation", "slug", "id", "secretkey", "created", "updated"]
+    _ignore_fields = ["obfuscation", "slug", "key", "id", "secretkey", "created", "updated"]
+
+
+bid_sorts = ('created', 'min', 'max', 'name')
 
 
 class Bid(SQLModel, table=True):
 
+    # serves the plain beetl lookups as well via its prefix, the others
+    # back the sort orders of /bids, see pagination.py
+    __table_args__ = (
+        Index("ix_bid_beetl_secretkey", "beetl_key", "secretkey"),
+        *[
+            Index(f"ix_bid_beetl_{sort}", "beetl_key", sort, "id")
+            for sort in bid_sorts
+        ],
+    )
+
     id: uuid_pkg.UUID = Field(
         default_factory=uuid_pkg.uuid4,
-        primary_key=True,
-        index=True,
-        nullable=False,
+        sa_column=Column(UUIDBlob, primary_key=True),
     )
     secretkey: str = Field(
         default_factory=secrets.token_urlsafe,
@@ -76,10 +218,36 @@ class Bid(SQLModel, table=True):
     min: int
     mid: Optional[int]
     max: int
-    beetl_obfuscation: str
-    beetl_slug: str
-    created: datetime = Field(default_factory=datetime.utcnow)
-    updated: datetime = Field(default_factory=datetime.utcnow)
+    # Beetl.key. the obfuscation and slug of the beetl aren't repeated in
+    # every bid, BidRead gets them from joining the beetl.
+    beetl_key: int
+    created: datetime = _timestamp()
+    updated: datetime = _timestamp()
 
     # shall not be updated by user
-    _ignore_fields = ["secretkey", "beetl_obfuscation", "beetl_slug", "created", "updated"]
+    _ignore_fields = ["secretkey", "beetl_obfuscation", "beetl_slug", "beetl_key", "created", "updated"]
+
+
+class BeetlAggregate(SQLModel, table=True):
+
+    # kept up to date with every bid write, see database/aggregates.py
+    beetl_obfuscation: str = Field(primary_key=True)
+    beetl_slug: str = Field(primary_key=True)
+    bids_count: int = 0
+    sum_min: int = 0
+    # missing mids count as their min, like in the settlement
+    sum_mid: int = 0
+    sum_max: int = 0
+    updated: datetime = _timestamp()
+
+
+class BeetlChange(SQLModel, table=True):
+
+    # the beetls written to, for the caches of other workers, see
+    # database/changes.py. autoincrement: ids are never handed out twice,
+    # not even after everything was pruned.
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    obfuscation: str
+    slug: str
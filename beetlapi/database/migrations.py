@@ -0,0 +1,183 @@
+from beetlapi.database.types import epoch, microsecond
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import logging
+import uuid
+
+# Every migration brings a database from version n-1 to n, n being its
+# position in `migrations` (starting at 1). The version is kept in
+# sqlite's `PRAGMA user_version`. Fresh databases get the current schema
+# from `create_all` already, so migrations have to be idempotent.
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(connection, table: str) -> list:
+    return [row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))]
+
+
+def _add_lookup_indexes(connection):
+
+    # the unique index needs one beetl per obfuscation and slug. the first
+    # one inserted stays, the others are logged before they go.
+    duplicates = "rowid NOT IN (SELECT min(rowid) FROM beetl GROUP BY obfuscation, slug)"
+    dropped = connection.execute(text(f"SELECT id, obfuscation, slug FROM beetl WHERE {duplicates}")).all()
+    if dropped:
+        logger.warning("dropping %s duplicate beetls: %s", len(dropped), [tuple(row) for row in dropped])
+        connection.execute(text(f"DELETE FROM beetl WHERE {duplicates}"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_beetl_obfuscation_slug "
+        "ON beetl (obfuscation, slug)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_bid_beetl_secretkey "
+        "ON bid (beetl_obfuscation, beetl_slug, secretkey)"
+    ))
+
+
+def _add_bid_aggregates(connection):
+
+    from beetlapi.database.aggregates import BeetlAggregate, rebuild_aggregates
+
+    BeetlAggregate.__table__.create(connection, checkfirst=True)
+    # before _compact_storage the bids don't look like rebuild_aggregates
+    # expects, that one rebuilds them then
+    if 'beetl_key' in _columns(connection, 'bid'):
+        rebuild_aggregates(connection)
+
+
+def _add_sort_indexes(connection):
+
+    for sort in ('created', 'min', 'max', 'name'):
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_bid_beetl_{sort} "
+            f"ON bid (beetl_obfuscation, beetl_slug, {sort}, id)"
+        ))
+
+
+def _uuid_blob(value):
+    return None if value is None else uuid.UUID(value).bytes
+
+
+def _epoch_microseconds(value):
+
+    if value is None:
+        return None
+    return (datetime.fromisoformat(value) - epoch) // microsecond
+
+
+def _compact_storage(connection):
+
+    # ids as 16 byte blobs, timestamps as integers, bids referring to the
+    # rowid of their beetl instead of repeating its obfuscation and slug.
+    # sqlite can't change column types, every table is copied into a new
+    # one. bids without a beetl are left behind, nothing could show them.
+    # `python -m beetlapi.database.repair vacuum` hands back the space.
+    from beetlapi.database.aggregates import rebuild_aggregates
+    from beetlapi.database.main import Beetl, BeetlAggregate, Bid
+
+    if 'beetl_key' in _columns(connection, 'bid'):
+        return
+
+    dbapi = connection.connection
+    dbapi.create_function('uuid_blob', 1, _uuid_blob, deterministic=True)
+    dbapi.create_function('epoch_microseconds', 1, _epoch_microseconds, deterministic=True)
+
+    tables = ['beetl', 'bid', 'beetlaggregate']
+    for table in tables:
+        indexes = connection.execute(text(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+        ), {'table': table}).scalars().all()
+        for index in indexes:
+            connection.execute(text(f'DROP INDEX "{index}"'))
+        connection.execute(text(f"ALTER TABLE {table} RENAME TO old_{table}"))
+
+    for model in [Beetl, Bid, BeetlAggregate]:
+        model.__table__.create(connection)
+
+    connection.execute(text(
+        "INSERT INTO beetl (key, id, secretkey, obfuscation, slug, title, description, "
+        "target, created, updated, method, beetlmode) "
+        "SELECT rowid, uuid_blob(id), secretkey, obfuscation, slug, title, description, "
+        "target, epoch_microseconds(created), epoch_microseconds(updated), method, beetlmode "
+        "FROM old_beetl"
+    ))
+    connection.execute(text(
+        "INSERT INTO bid (id, secretkey, name, min, mid, max, beetl_key, created, updated) "
+        "SELECT uuid_blob(bid.id), bid.secretkey, bid.name, bid.min, bid.mid, bid.max, beetl.key, "
+        "epoch_microseconds(bid.created), epoch_microseconds(bid.updated) "
+        "FROM old_bid AS bid JOIN beetl "
+        "ON beetl.obfuscation = bid.beetl_obfuscation AND beetl.slug = bid.beetl_slug"
+    ))
+
+    orphans = connection.execute(text(
+        "SELECT (SELECT count(*) FROM old_bid) - (SELECT count(*) FROM bid)"
+    )).scalar()
+    if orphans:
+        logger.warning("left %s bids without a beetl behind", orphans)
+
+    for table in tables:
+        connection.execute(text(f"DROP TABLE old_{table}"))
+    rebuild_aggregates(connection)
+
+
+def _beetl_autoincrement(connection):
+
+    # _compact_storage made beetl keys without AUTOINCREMENT at first, so
+    # the key of the last beetl was handed out again after it was deleted
+    from beetlapi.database.main import Beetl
+
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'beetl'")).scalar()
+    if 'AUTOINCREMENT' in sql:
+        return
+
+    connection.execute(text("DROP INDEX IF EXISTS ix_beetl_obfuscation_slug"))
+    connection.execute(text("ALTER TABLE beetl RENAME TO old_beetl"))
+    Beetl.__table__.create(connection)
+    columns = ', '.join(f'"{column.name}"' for column in Beetl.__table__.c)
+    connection.execute(text(f"INSERT INTO beetl ({columns}) SELECT {columns} FROM old_beetl"))
+    connection.execute(text("DROP TABLE old_beetl"))
+
+
+migrations = [
+    _add_lookup_indexes,
+    _add_bid_aggregates,
+    _add_sort_indexes,
+    _compact_storage,
+    _beetl_autoincrement,
+]
+
+
+def get_version(connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def _begin_immediate(connection):
+
+    # another worker may migrate for longer than busy_timeout
+    while True:
+        try:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            logger.info("waiting for another migration to finish")
+
+
+def migrate(engine):
+
+    # all of it in one transaction. pysqlite only opens one before DML, the
+    # renames and creates of a migration would commit on their own and a
+    # failed copy would leave the data behind in old_* tables. IMMEDIATE
+    # takes the write lock up front: workers starting together migrate one
+    # after the other, the later ones find nothing left to do.
+    with engine.begin() as connection:
+        _begin_immediate(connection)
+        version = get_version(connection)
+
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            migration(connection)
+            connection.execute(text(f"PRAGMA user_version = {number}"))
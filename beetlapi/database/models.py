@@ -28,7 +28,7 @@ class BeetlRead(BeetlCreate):
 
 class BeetlDeleteResponse(BeetlRead):
 
-    pass
+    bids_deleted: int
 
 
 class BidCreate(SQLModel):
@@ -60,6 +60,14 @@ class BidsRead(SQLModel):
 
     bids_total: int
     bids: list[BidRead]
+    # pass as `cursor` to get the next page, None on the last one
+    next_cursor: Optional[str] = None
+
+class BeetlFullRead(BeetlRead):
+
+    bids_total: int
+    # empty for private beetls
+    bids: list[BidRead]
 
 class BidPatch(BidCreate):
 
@@ -73,6 +81,20 @@ class BidDeleteResponse(BidRead):
     
     pass
 
+class BidBatchResult(SQLModel):
+
+    # position in the posted list
+    index: int
+    status: Literal['created', 'invalid']
+    id: Optional[uuid.UUID] = None
+    secretkey: Optional[str] = None
+    errors: Optional[list[dict]] = None
+
+class BidsBatchCreateRead(SQLModel):
+
+    created: int
+    results: list[BidBatchResult]
+
 class BidCheckSecretKey(SQLModel):
     secretkey: str
     id: uuid.UUID
@@ -80,3 +102,27 @@ class BidCheckSecretKey(SQLModel):
 class BidCheckSecretKeyResponse(SQLModel):
     status: Literal['success', 'failed']
 
+
+
+class BidContribution(SQLModel):
+
+    id: uuid.UUID
+    name: str
+    amount: float
+
+class SettlementRead(SQLModel):
+
+    method: str
+    target: Optional[int]
+    status: Literal['covered', 'not_covered', 'no_target']
+    # 0: everyone pays min, 1: first step / percentage, 2: second step
+    step: int
+    factor: float
+    total: float
+    total_min: int
+    total_mid: int
+    total_max: int
+    shortfall: float
+    bids_total: int
+    # empty for private beetls
+    contributions: list[BidContribution]
@@ -0,0 +1,119 @@
+from beetlapi.database.main import (
+    Beetl, BeetlAggregate, Bid, create_shard_engine, incremental_vacuum, shard_count, shard_file_name, shard_of,
+)
+from beetlapi.database.migrations import migrate
+from sqlalchemy import delete, insert, select, tuple_
+from sqlmodel import SQLModel
+import logging
+import os
+
+# Moves every beetl, its bids and its aggregate to the shard its
+# obfuscation hashes to, after BEETL_SHARDS changed (or when going from a
+# single file to shards). Shard files beyond the new count are emptied.
+# Stop the api while this runs, it doesn't see writes arriving meanwhile.
+#
+# Rows are copied before they are deleted from their old shard. Copies
+# replace what's there, so a rebalance that died halfway can simply be
+# run again. Beetl keys are local to their file: a beetl gets a new one in
+# its new shard and its bids are rewritten to refer to that.
+
+logger = logging.getLogger(__name__)
+
+beetl_columns = [column for column in Beetl.__table__.c if column.name != 'key']
+
+
+def _leftover_shards(count: int) -> list:
+
+    shards = []
+    while os.path.exists(shard_file_name(count + len(shards))):
+        shards.append(count + len(shards))
+    return shards
+
+
+def _keys(connection) -> list:
+    return connection.execute(select(Beetl.obfuscation, Beetl.slug)).all()
+
+
+def _beetl_keys(connection, keys: list) -> dict:
+
+    # (obfuscation, slug): Beetl.key
+    rows = connection.execute(
+        select(Beetl.obfuscation, Beetl.slug, Beetl.key)
+        .where(tuple_(Beetl.obfuscation, Beetl.slug).in_(keys))
+    )
+    return {(obfuscation, slug): key for obfuscation, slug, key in rows}
+
+
+def move(source, target, keys: list, chunk_size: int = 500) -> int:
+
+    # returns the number of bids moved
+    bids = 0
+    aggregates = tuple_(BeetlAggregate.beetl_obfuscation, BeetlAggregate.beetl_slug).in_(keys)
+    with source.connect() as reading, target.begin() as writing:
+        old_keys = _beetl_keys(reading, keys)
+        beetls = reading.execute(
+            select(*beetl_columns).where(Beetl.key.in_(old_keys.values()))
+        ).mappings().all()
+        # a beetl already in the target (from a rebalance that died) is
+        # replaced, a new key included
+        writing.execute(insert(Beetl.__table__).prefix_with('OR REPLACE'), [dict(row) for row in beetls])
+        new_keys = _beetl_keys(writing, keys)
+        moved_keys = {old_keys[key]: new_keys[key] for key in old_keys}
+
+        result = reading.execute(
+            select(Bid.__table__)
+            .where(Bid.beetl_key.in_(old_keys.values()))
+            .execution_options(yield_per=chunk_size)
+        )
+        for rows in result.mappings().partitions(chunk_size):
+            rows = [{**row, 'beetl_key': moved_keys[row['beetl_key']]} for row in rows]
+            writing.execute(insert(Bid.__table__).prefix_with('OR REPLACE'), rows)
+            bids += len(rows)
+
+        rows = reading.execute(select(BeetlAggregate.__table__).where(aggregates)).mappings().all()
+        if rows:
+            writing.execute(insert(BeetlAggregate.__table__).prefix_with('OR REPLACE'), [dict(row) for row in rows])
+
+    with source.begin() as connection:
+        connection.execute(delete(Bid).where(Bid.beetl_key.in_(old_keys.values())))
+        connection.execute(delete(BeetlAggregate).where(aggregates))
+        connection.execute(delete(Beetl).where(Beetl.key.in_(old_keys.values())))
+
+    return bids
+
+
+def rebalance(count: int = None, chunk_size: int = 500) -> dict:
+
+    count = count or shard_count
+    sources = list(range(count)) + _leftover_shards(count)
+    shard_engines = {shard: create_shard_engine(shard_file_name(shard)) for shard in sources}
+
+    for shard in range(count):
+        SQLModel.metadata.create_all(shard_engines[shard])
+        migrate(shard_engines[shard])
+
+    moved = {'beetls': 0, 'bids': 0}
+    for source in sources:
+        with shard_engines[source].connect() as connection:
+            keys = [tuple(key) for key in _keys(connection)]
+
+        targets = {}
+        for key in keys:
+            target = shard_of(key[0], count)
+            if target != source:
+                targets.setdefault(target, []).append(key)
+
+        for target, target_keys in targets.items():
+            for start in range(0, len(target_keys), chunk_size):
+                chunk = target_keys[start:start + chunk_size]
+                moved['bids'] += move(shard_engines[source], shard_engines[target], chunk, chunk_size)
+                moved['beetls'] += len(chunk)
+            logger.info("moved %s beetls from shard %s to %s", len(target_keys), source, target)
+
+        incremental_vacuum(shard_engines[source])
+
+    for shard_engine in shard_engines.values():
+        shard_engine.dispose()
+
+    moved['empty'] = [shard_file_name(shard) for shard in sources[count:]]
+    return moved
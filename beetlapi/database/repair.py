@@ -0,0 +1,52 @@
+from beetlapi.database.main import engines
+from beetlapi.database.aggregates import rebuild_aggregates
+from beetlapi.database.rebalance import rebalance as rebalance_shards
+import sys
+
+# rebuilds what can be derived from the data, in every shard
+#
+#     python -m beetlapi.database.repair [aggregates] [vacuum] [rebalance]
+#
+# aggregates: recounts the beetl aggregates from the bids
+# vacuum: rewrites the whole file, which turns on incremental vacuuming for
+#     databases created before it was the default. locks the database
+#     while it runs.
+# rebalance: moves the beetls to their shards after BEETL_SHARDS changed,
+#     with the api stopped. see database/rebalance.py
+
+
+def aggregates():
+
+    for engine in engines:
+        with engine.begin() as connection:
+            print(f"{engine.url.database}: rebuilt {rebuild_aggregates(connection)} beetl aggregates")
+
+
+def vacuum():
+
+    # auto_vacuum is already set on every connection, VACUUM applies it
+    for engine in engines:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+            mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        print(f"{engine.url.database}: vacuumed, auto_vacuum is {mode}")
+
+
+def rebalance():
+
+    moved = rebalance_shards()
+    print(f"moved {moved['beetls']} beetls and {moved['bids']} bids")
+    for file_name in moved['empty']:
+        print(f"{file_name} is not a shard anymore and can be removed")
+
+
+commands = {
+    'aggregates': aggregates,
+    'vacuum': vacuum,
+    'rebalance': rebalance,
+}
+
+if __name__ == '__main__':
+
+    for command in sys.argv[1:] or ['aggregates']:
+        commands[command]()
@@ -0,0 +1,132 @@
+from beetlapi.database.changes import record_changes
+from beetlapi.database.main import Beetl, BeetlAggregate, Bid, incremental_vacuum
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, exists, select, tuple_
+from typing import Callable, Optional
+import logging
+import time
+
+# Beetls nobody touched for `max_age` are purged together with their bids:
+# neither the beetl itself nor any of its bids were written since. A beetl
+# goes in one transaction with its aggregate and all of its bids, and only
+# when it is still expired then: a write since the pass picked it keeps it.
+# Transactions take beetls until their bids add up to about `chunk_size`,
+# so the write lock is only ever held briefly (a beetl with more bids than
+# that still goes in one). Freed pages are handed back by an incremental
+# vacuum afterwards.
+
+logger = logging.getLogger(__name__)
+
+stats = {
+    'passes': 0,
+    'beetls': 0,
+    'bids': 0,
+    'seconds': 0,
+    'last_pass': None,
+}
+
+
+def _expired(cutoff: datetime):
+
+    # neither the beetl nor, going by its aggregate, any of its bids
+    # were written after cutoff
+    return and_(
+        Beetl.updated <= cutoff,
+        ~exists().where(
+            BeetlAggregate.beetl_obfuscation == Beetl.obfuscation,
+            BeetlAggregate.beetl_slug == Beetl.slug,
+            BeetlAggregate.updated > cutoff,
+        ).correlate(Beetl),
+    )
+
+
+def _expired_beetls(connection, cutoff: datetime, chunk_size: int) -> list:
+
+    return connection.execute(
+        select(Beetl.key, Beetl.obfuscation, Beetl.slug, BeetlAggregate.bids_count)
+        .outerjoin(BeetlAggregate, and_(
+            BeetlAggregate.beetl_obfuscation == Beetl.obfuscation,
+            BeetlAggregate.beetl_slug == Beetl.slug,
+        ))
+        .where(_expired(cutoff))
+        .limit(chunk_size)
+    ).all()
+
+
+def _chunks(expired: list, chunk_size: int):
+
+    chunk, bids = [], 0
+    for beetl in expired:
+        if chunk and bids + (beetl.bids_count or 0) > chunk_size:
+            yield chunk
+            chunk, bids = [], 0
+        chunk.append(beetl)
+        bids += beetl.bids_count or 0
+    if chunk:
+        yield chunk
+
+
+def _purge(engine, expired: list, cutoff: datetime) -> tuple:
+
+    # returns the (obfuscation, slug) keys purged and the number of bids.
+    # the delete comes first: holding the write lock, what it left behind
+    # can't change anymore.
+    beetl_keys = [beetl.key for beetl in expired]
+    with engine.begin() as connection:
+        connection.execute(delete(Beetl).where(Beetl.key.in_(beetl_keys)).where(_expired(cutoff)))
+        kept = set(connection.execute(select(Beetl.key).where(Beetl.key.in_(beetl_keys))).scalars())
+        purged = [beetl for beetl in expired if beetl.key not in kept]
+        if not purged:
+            return [], 0
+
+        keys = [(beetl.obfuscation, beetl.slug) for beetl in purged]
+        bids = connection.execute(delete(Bid).where(Bid.beetl_key.in_([beetl.key for beetl in purged]))).rowcount
+        connection.execute(
+            delete(BeetlAggregate)
+            .where(tuple_(BeetlAggregate.beetl_obfuscation, BeetlAggregate.beetl_slug).in_(keys))
+        )
+        record_changes(connection, keys)
+    return keys, bids
+
+
+def purge_expired(
+        engine,
+        max_age: timedelta,
+        chunk_size: int = 500,
+        on_purge: Optional[Callable[[list], None]] = None,
+    ) -> dict:
+
+    # on_purge gets the (obfuscation, slug) keys of every purged chunk
+    start = time.monotonic()
+    cutoff = datetime.utcnow() - max_age
+    beetls = bids = 0
+
+    while True:
+        with engine.connect() as connection:
+            expired = _expired_beetls(connection, cutoff, chunk_size)
+        if not expired:
+            break
+
+        for chunk in _chunks(expired, chunk_size):
+            keys, count = _purge(engine, chunk, cutoff)
+            beetls += len(keys)
+            bids += count
+            if on_purge and keys:
+                on_purge(keys)
+
+    incremental_vacuum(engine)
+
+    result = {
+        'beetls': beetls,
+        'bids': bids,
+        'seconds': time.monotonic() - start,
+        'finished': datetime.utcnow(),
+    }
+    stats['passes'] += 1
+    stats['beetls'] += beetls
+    stats['bids'] += bids
+    stats['seconds'] += result['seconds']
+    stats['last_pass'] = result
+
+    logger.info("retention purged %s beetls and %s bids in %.3fs", beetls, bids, result['seconds'])
+    return result
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.types import BigInteger, LargeBinary, TypeDecorator
+import uuid
+
+# compact storage for what the models see as uuids and datetimes: 16 bytes
+# instead of 32 hex characters, an integer of microseconds since the epoch
+# instead of 26 characters of iso text. both sort the same way as before.
+
+epoch = datetime(1970, 1, 1)
+microsecond = timedelta(microseconds=1)
+
+
+class UUIDBlob(TypeDecorator):
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else uuid.UUID(bytes=bytes(value))
+
+
+class EpochMicroseconds(TypeDecorator):
+
+    # naive datetimes are utc, like everything from datetime.utcnow()
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+
+        if value is None:
+            return None
+        if value.tzinfo:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - epoch) // microsecond
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else epoch + value * microsecond
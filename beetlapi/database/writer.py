@@ -0,0 +1,129 @@
+from concurrent.futures import Future
+from contextvars import copy_context
+from sqlmodel import Session
+from threading import Thread
+from typing import Any, Callable
+import logging
+import queue
+import time
+
+# Group commit: writes from concurrent requests are handed to one writer
+# thread, which runs everything that arrived within `window` seconds in a
+# single transaction. sqlite then takes its lock and syncs once per batch
+# instead of once per request, and writers never fight over the lock.
+#
+# A write is a function taking the session. Each runs in its own savepoint:
+# when it raises, only its own changes are rolled back and only its caller
+# gets the error, the others still commit. When the commit itself fails,
+# every caller of the batch gets that error.
+#
+# Writes run in the context of the request that submitted them, so metrics
+# and the slow-query log still see its route.
+
+logger = logging.getLogger(__name__)
+
+Operation = Callable[[Session], Any]
+
+
+def _in_savepoint(session: Session, operation: Operation) -> Any:
+
+    # the savepoint flushes on release, which may raise too
+    with session.begin_nested():
+        return operation(session)
+
+
+class GroupCommitWriter:
+
+    def __init__(self, engine, window: float = 0.002, max_batch: int = 64):
+
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='group-commit', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+
+        # whatever is queued already still gets written
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, operation: Operation) -> Any:
+
+        # blocks the calling thread until the batch is committed
+        future = Future()
+        self._queue.put((operation, copy_context(), future))
+        self.start()
+        return future.result()
+
+    def _collect(self) -> tuple:
+
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list):
+
+        results = []
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                # takes the write lock up front. an explicit transaction
+                # also keeps the first savepoint from being the outermost
+                # one, releasing that would commit right away.
+                session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+
+                for operation, context, future in batch:
+                    try:
+                        result = context.run(_in_savepoint, session, operation)
+                    except Exception as error:
+                        results.append((future, None, error))
+                    else:
+                        results.append((future, result, None))
+
+                session.commit()
+        except Exception as error:
+            logger.exception("group commit of %s writes failed", len(batch))
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,27 @@
+from fastapi import Response
+from typing import Optional
+import hashlib
+
+# weak etags for conditional GETs. they are derived from what the response
+# is made of (ids, `updated` timestamps, counts), never from the serialized
+# body, so a match can be answered before loading or serializing anything.
+
+
+def make_etag(*parts) -> str:
+
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+
+    if not if_none_match:
+        return False
+
+    # weak comparison, as If-None-Match demands
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag})
@@ -0,0 +1,82 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+import asyncio
+import json
+
+# in-process pub/sub for live updates per beetl. handlers publish from the
+# threadpool, subscribers are server-sent event streams on the event loop.
+#
+# every subscriber has its own bounded queue. when a viewer can't keep up
+# its queue is thrown away and replaced by a `resync` event, telling it to
+# fetch /bids again, so nobody ever waits for a slow viewer.
+
+
+class Subscription:
+
+    def __init__(self, maxsize: int):
+
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max(maxsize, 2))
+        self.resyncs = 0
+
+    def put(self, event):
+
+        # only ever called on self.loop
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('resync', '{}'))
+            self.resyncs += 1
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Hub:
+
+    def __init__(self, queue_size: int):
+
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = Lock()
+
+    @contextmanager
+    def subscribe(self, key):
+
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscriptions[key].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions[key].discard(subscription)
+                if not self._subscriptions[key]:
+                    del self._subscriptions[key]
+
+    def has_subscribers(self, key) -> bool:
+        return key in self._subscriptions
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return sum(map(len, self._subscriptions.values()))
+
+    def publish(self, key, type: str, data: dict):
+
+        # encoded once, no matter how many are listening
+        event = (type, json.dumps(data))
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(key, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # its loop is gone already
+                pass
+
+
+def server_sent_event(type: str, data: str) -> str:
+    return f"event: {type}\ndata: {data}\n\n"
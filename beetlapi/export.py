@@ -0,0 +1,76 @@
+from beetlapi.database.main import Beetl, Bid, engine_for
+from beetlapi.serialization import bid_column, select_bids
+from datetime import datetime
+from sqlmodel import Session
+from typing import Iterator
+import csv
+import io
+import json
+import uuid
+
+# streams the bids of a beetl batch by batch, sqlite hands them out through
+# a cursor as they are consumed, so memory doesn't grow with the beetl.
+# bids of private beetls are not `visible`, those exports stay empty.
+
+columns = ['id', 'name', 'min', 'mid', 'max', 'beetl_obfuscation', 'beetl_slug', 'created', 'updated']
+
+media_types = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _plain(value):
+
+    # the way the json api shows them
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _batches(obfuscation: str, slug: str, visible: bool, batch_size: int) -> Iterator[list]:
+
+    if not visible:
+        return
+
+    with Session(engine_for(obfuscation, read_only=True)) as session:
+        result = session.execute(
+            select_bids(*[bid_column(column) for column in columns])
+            .where(Beetl.obfuscation == obfuscation)
+            .where(Beetl.slug == slug)
+            .order_by(Bid.created, Bid.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for batch in result.partitions():
+            yield [[_plain(value) for value in row] for row in batch]
+
+
+def export_ndjson(obfuscation: str, slug: str, visible: bool, batch_size: int = 500) -> Iterator[bytes]:
+
+    for batch in _batches(obfuscation, slug, visible, batch_size):
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in batch).encode()
+
+
+def export_csv(obfuscation: str, slug: str, visible: bool, batch_size: int = 500) -> Iterator[bytes]:
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for batch in _batches(obfuscation, slug, visible, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        # nothing but the header
+        yield buffer.getvalue().encode()
+
+
+exporters = {
+    'ndjson': export_ndjson,
+    'csv': export_csv,
+}
@@ -6,6 +6,8 @@ from beetlapi.database.main import (
     BeetlCreateRead,
     BeetlDeleteResponse,
     BidsRead,
+    BeetlFullRead,
+    BeetlAggregate,
     BidCreate,
     BidCreateRead,
     BidRead,
@@ -14,14 +16,50 @@ from beetlapi.database.main import (
     BidDelete,
     BidDeleteResponse,
     BidCheckSecretKey,
-    BidCheckSecretKeyResponse
+    BidCheckSecretKeyResponse,
+    SettlementRead,
+    BidsBatchCreateRead,
 )
-from fastapi import FastAPI, HTTPException
-from beetlapi.database.main import create_db_and_tables, engine
+from fastapi import Body, Depends, FastAPI, HTTPException, Header, Query, Response
+from beetlapi.database.main import create_db_and_tables, engine_for, engines, read_engines
+from beetlapi.database.retention import purge_expired, stats as retention_stats
+from beetlapi.database.writer import GroupCommitWriter
+from beetlapi.database.changes import ChangeFeed, record_changes
+from beetlapi.database.aggregates import (
+    bid_values,
+    delete_aggregate,
+    get_aggregate,
+    track_bid,
+    track_new_bids,
+)
+from beetlapi.settlement import settle, settle_totals
+from beetlapi.cache import LRUCache
+from beetlapi.etag import make_etag, etag_matches, not_modified
+from beetlapi.pagination import paginate, encode_cursor
+from beetlapi.export import exporters, media_types
+from beetlapi.events import Hub, server_sent_event
+from beetlapi import metrics, slowlog
+from beetlapi.serialization import (
+    beetl_columns, beetl_content, beetl_fields, bid_columns, bid_content, bid_dict, bid_fields, select_bids,
+    settlement_content,
+)
+from beetlapi.sessions import Sessions, UnitOfWorkRoute, get_sessions, read_only
 from sqlmodel import Session, select, delete
-from datetime import datetime
+from sqlalchemy import and_, bindparam, insert
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+from datetime import datetime, timedelta
+from typing import Any, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from os import environ
+from functools import partial
+import anyio
+import asyncio
+import json
+import logging
 
 origins =['https://beetl.xyz']
 if environ.get('DEVDEVDEV'):
@@ -34,6 +72,7 @@ app = FastAPI(
     docs_url="/api/docs",
     redoc_url="/api/redoc",
 )
+app.router.route_class = UnitOfWorkRoute
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -41,127 +80,662 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     )
+app.add_middleware(metrics.MetricsMiddleware)
+for shard_engine in engines + read_engines:
+    metrics.instrument(shard_engine)
+
+    # opt-in, statements slower than that are logged with their query plan
+    if environ.get('BEETL_SLOW_QUERY_MS'):
+        slowlog.enable(
+            shard_engine,
+            threshold=float(environ['BEETL_SLOW_QUERY_MS']) / 1000,
+            path=environ.get('BEETL_SLOW_QUERY_LOG', 'slow-queries.log'),
+            max_bytes=int(environ.get('BEETL_SLOW_QUERY_LOG_BYTES', 10_000_000)),
+        )
+
+beetl_cache = LRUCache(
+    maxsize=int(environ.get('BEETL_CACHE_SIZE', 1024)),
+    ttl=float(environ.get('BEETL_CACHE_TTL', 60)),
+)
 
-def _get_beetl(obfuscation:str, slug:str):
-    with Session(engine) as session:
-        beetl = session.exec(
-            select(Beetl)
-            .where(Beetl.obfuscation == obfuscation)
-            .where(Beetl.slug == slug)
-        ).first()
+# encoded GET /bids bodies and their etags per beetl, bounded in bytes.
+# every write to a beetl or its bids drops its entry.
+bids_cache = LRUCache(
+    maxsize=int(environ.get('BEETL_BIDS_CACHE_BYTES', 32_000_000)),
+    ttl=float(environ.get('BEETL_BIDS_CACHE_TTL', 5)),
+    weigh=lambda entry: len(entry[1]),
+)
+
+def _cache_counters() -> dict:
+    return {
+        (name, event): getattr(cache, event)
+        for name, cache in [('beetl', beetl_cache), ('bids', bids_cache)]
+        for event in ['hits', 'misses', 'evictions']
+    }
+
+metrics.registry += [
+    metrics.Collected(
+        'beetl_cache_events_total', 'Cache hits, misses and evictions.', 'counter',
+        ('cache', 'event'), _cache_counters,
+    ),
+    metrics.Collected(
+        'beetl_cache_size', 'Cached beetls, and bytes of cached /bids bodies.', 'gauge',
+        ('cache',), lambda: {('beetl',): beetl_cache.size, ('bids',): bids_cache.size},
+    ),
+]
+
+def _select_beetl(session: Session, obfuscation: str, slug: str):
+    return session.exec(
+        select(Beetl)
+        .where(Beetl.obfuscation == obfuscation)
+        .where(Beetl.slug == slug)
+    ).first()
+
+# bids only go in while their beetl is there: the beetl of a bid write
+# comes from the cache or a reader and may be gone by now, deleted by
+# this worker or another one. a row per bid whose beetl_key still exists,
+# rowcount tells how many did.
+insert_bids = insert(Bid).from_select(
+    [column.name for column in Bid.__table__.c],
+    select(*[
+        Beetl.key if column.name == 'beetl_key' else bindparam(column.name, type_=column.type)
+        for column in Bid.__table__.c
+    ]).where(Beetl.key == bindparam('beetl_key')),
+)
 
+beetl_not_found = {'loc': ['beetl_slug'], 'msg': 'beetl not found', 'type': 'value_error.not_found'}
+
+def _get_beetl(obfuscation:str, slug:str, session: Session = None):
+
+    # shared between requests, don't change what you get from here.
+    # writers use _select_beetl and invalidate the cache afterwards.
+    # without the session of a request it reads on a session of its own.
+    key = (obfuscation, slug)
+    beetl = beetl_cache.get(key)
+    if beetl:
+        return beetl
+
+    generation = beetl_cache.generation
+    if session:
+        beetl = _select_beetl(session, obfuscation, slug)
+    else:
+        with Session(engine_for(obfuscation, read_only=True)) as session:
+            beetl = _select_beetl(session, obfuscation, slug)
+
+    if beetl:
+        beetl_cache.set(key, beetl, generation)
     return beetl
 
+hub = Hub(queue_size=int(environ.get('BEETL_EVENTS_QUEUE_SIZE', 64)))
+events_keepalive = 15
+
+def _bids_total(obfuscation: str, slug: str) -> int:
+    with Session(engine_for(obfuscation, read_only=True)) as session:
+        return get_aggregate(session, obfuscation, slug).bids_count
+
+def _publish(type: str, obfuscation: str, slug: str, bids: list = ()):
+
+    # after the commit. totals for everyone, the bids only for public beetls
+    key = (obfuscation, slug)
+    if not hub.has_subscribers(key):
+        return
+
+    data = {'bids_total': _bids_total(obfuscation, slug)}
+
+    beetl = _get_beetl(obfuscation, slug)
+    if beetl and beetl.beetlmode == 'public':
+        data['bids'] = jsonable_encoder([BidRead(**bid_dict(bid, obfuscation, slug)) for bid in bids])
+
+    hub.publish(key, type, data)
+
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
 
+# with BEETL_GROUP_COMMIT_MS set, writes of concurrent requests that arrive
+# within that many ms are committed together, see database/writer.py.
+# one writer per shard.
+group_commit_window = float(environ.get('BEETL_GROUP_COMMIT_MS', 0)) / 1000
+writers = {}
+if group_commit_window:
+    writers = {
+        shard_engine: GroupCommitWriter(
+            shard_engine,
+            window=group_commit_window,
+            max_batch=int(environ.get('BEETL_GROUP_COMMIT_MAX', 64)),
+        )
+        for shard_engine in engines
+    }
+
+def _write(session: Session, operation):
+
+    # runs operation(session) and flushes, so constraint errors show up
+    # here, returning what it returns. the session is the request's one of
+    # the shard, which commits when the request is done. with group commit
+    # the writer of the shard runs it and commits right away instead.
+    # invalidating and publishing go to sessions.on_commit.
+    if session.bind in writers:
+        return writers[session.bind].submit(operation)
+
+    result = operation(session)
+    session.flush()
+    return result
+
+@app.on_event("shutdown")
+def stop_writers():
+    for writer in writers.values():
+        writer.stop()
+
+# The handlers are plain functions talking to the database synchronously,
+# fastapi runs them on anyios threadpool instead of blocking the event loop.
+# sqlite has a single writer and the orm work holds the GIL, so more threads
+# mostly help with slow storage. see bench/concurrency.py
+threadpool_size = int(environ.get('BEETL_THREADPOOL_SIZE', 8))
+
+@app.on_event("startup")
+async def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = threadpool_size
+
+# beetls without any writes for that many days get purged, off when unset
+retention_days = float(environ.get('BEETL_RETENTION_DAYS', 0))
+retention_interval = float(environ.get('BEETL_RETENTION_INTERVAL', 3600))
+retention_chunk = int(environ.get('BEETL_RETENTION_CHUNK', 500))
+
+metrics.registry += [
+    metrics.Collected(
+        'beetl_retention_passes_total', 'Retention passes, one per shard each time.', 'counter',
+        (), lambda: {(): retention_stats['passes']},
+    ),
+    metrics.Collected(
+        'beetl_retention_purged_total', 'Beetls and bids purged by retention.', 'counter',
+        ('table',), lambda: {('beetl',): retention_stats['beetls'], ('bid',): retention_stats['bids']},
+    ),
+    metrics.Collected(
+        'beetl_retention_seconds_total', 'Time spent in retention passes.', 'counter',
+        (), lambda: {(): retention_stats['seconds']},
+    ),
+    metrics.Collected(
+        'beetl_retention_last_pass_seconds', 'How long the last retention pass took.', 'gauge',
+        (), lambda: {(): (retention_stats['last_pass'] or {}).get('seconds', 0)},
+    ),
+]
+
+def _purged(keys: list):
+    for key in keys:
+        beetl_cache.invalidate(key)
+        bids_cache.invalidate(key)
+
+async def _retention():
+
+    while True:
+        await asyncio.sleep(retention_interval)
+        try:
+            for shard_engine in engines:
+                await run_in_threadpool(
+                    purge_expired,
+                    shard_engine,
+                    timedelta(days=retention_days),
+                    retention_chunk,
+                    _purged,
+                )
+        except Exception:
+            logging.getLogger(__name__).exception("retention pass failed")
+
+# other workers' writes, see database/changes.py. each worker drops what
+# they changed within that many ms.
+changes_poll_interval = float(environ.get('BEETL_CHANGES_POLL_MS', 250)) / 1000
+change_feeds = {shard_engine: ChangeFeed(read_engines[shard]) for shard, shard_engine in enumerate(engines)}
+
+def _evict_changes():
+
+    for shard_engine, feed in change_feeds.items():
+        keys = feed.poll()
+        if keys is None:
+            beetl_cache.clear()
+            bids_cache.clear()
+            keys = ()
+        for key in keys:
+            beetl_cache.invalidate(key)
+            bids_cache.invalidate(key)
+        feed.prune(shard_engine)
+
+async def _follow_changes():
+
+    while True:
+        try:
+            await run_in_threadpool(_evict_changes)
+        except Exception:
+            logging.getLogger(__name__).exception("following changes failed")
+        await asyncio.sleep(changes_poll_interval)
+
+@app.on_event("startup")
+async def schedule_changes():
+    if changes_poll_interval:
+        app.state.changes = asyncio.create_task(_follow_changes())
+
+@app.on_event("shutdown")
+async def stop_changes():
+    if getattr(app.state, 'changes', None):
+        app.state.changes.cancel()
+        for feed in change_feeds.values():
+            feed.close()
+
+@app.on_event("startup")
+async def schedule_retention():
+    if retention_days:
+        app.state.retention = asyncio.create_task(_retention())
+
+@app.on_event("shutdown")
+async def stop_retention():
+    if getattr(app.state, 'retention', None):
+        app.state.retention.cancel()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/beetl", response_model=BeetlCreateRead)
-async def post_beetl(beetl: BeetlCreate):
+def post_beetl(beetl: BeetlCreate, sessions: Sessions = Depends(get_sessions)):
 
-    with Session(engine) as session:
-        beetl = Beetl.from_orm(beetl)
-        session.add(beetl)
-        session.commit()
-        session.refresh(beetl)
+    beetl = Beetl.from_orm(beetl)
+    try:
+        _write(sessions(beetl.obfuscation), lambda session: session.add(beetl))
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Beetl already exists")
 
     return beetl
 
 @app.get("/beetl", response_model=BeetlRead)
-async def get_beetl(obfuscation: str, slug: str):
-
-    beetl = _get_beetl(obfuscation, slug)
-    return beetl
+def get_beetl(
+        obfuscation: str,
+        slug: str,
+        if_none_match: Optional[str] = Header(None),
+        sessions: Sessions = Depends(get_sessions),
+    ):
+
+    beetl = _get_beetl(obfuscation, slug, sessions(obfuscation))
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    etag = make_etag(beetl.id, beetl.updated)
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    return ORJSONResponse(beetl_content(beetl), headers={'ETag': etag})
+
+@app.get("/beetl/settlement", response_model=SettlementRead)
+def get_settlement(obfuscation: str, slug: str, sessions: Sessions = Depends(get_sessions)):
+
+    beetl = _get_beetl(obfuscation, slug, sessions(obfuscation))
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    session = sessions(obfuscation)
+
+    if beetl.beetlmode == 'private':
+        # nobody gets to see the bids, the totals are enough
+        aggregate = get_aggregate(session, obfuscation, slug)
+        try:
+            settlement = settle_totals(
+                beetl.method,
+                beetl.target,
+                aggregate.sum_min,
+                aggregate.sum_mid,
+                aggregate.sum_max,
+            )
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+
+        settlement['bids_total'] = aggregate.bids_count
+        return ORJSONResponse(settlement_content(settlement, []))
+
+    bids = session.exec(
+        select(Bid.id, Bid.name, Bid.min, Bid.mid, Bid.max)
+        .where(Bid.beetl_key == beetl.key)
+    ).all()
+
+    ids, names, mins, mids, maxs = zip(*bids) if bids else ((),) * 5
+
+    try:
+        settlement = settle(beetl.method, beetl.target, mins, mids, maxs)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    # tens of thousands of bids are common, see serialization.py
+    settlement['bids_total'] = len(bids)
+    contributions = zip(ids, names, settlement.pop('amounts'))
+    return ORJSONResponse(settlement_content(settlement, contributions))
+
+@app.get("/beetl/full", response_model=BeetlFullRead)
+def get_beetl_full(
+        obfuscation: str,
+        slug: str,
+        if_none_match: Optional[str] = Header(None),
+        sessions: Sessions = Depends(get_sessions),
+    ):
+
+    # what a page view needs (the beetl, its totals and the bids it may
+    # show) in one query: a row per bid, the beetl repeated in each. the
+    # join on bids only matches for public beetls.
+    rows = sessions(obfuscation).exec(
+        select(Beetl.id, *beetl_columns, BeetlAggregate.bids_count, BeetlAggregate.updated, *bid_columns)
+        .outerjoin(BeetlAggregate, and_(
+            BeetlAggregate.beetl_obfuscation == Beetl.obfuscation,
+            BeetlAggregate.beetl_slug == Beetl.slug,
+        ))
+        .outerjoin(Bid, and_(Bid.beetl_key == Beetl.key, Beetl.beetlmode == 'public'))
+        .where(Beetl.obfuscation == obfuscation)
+        .where(Beetl.slug == slug)
+        .order_by(Bid.created, Bid.id)
+    ).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    # beetl id, beetl, bids_count, aggregate updated, bid
+    beetl_end = 1 + len(beetl_fields)
+    beetl_id, *beetl = rows[0][:beetl_end]
+    bids_total, aggregate_updated = rows[0][beetl_end:beetl_end + 2]
+    bid_id = beetl_end + 2 + bid_fields.index('id')
+    bids = [row[beetl_end + 2:] for row in rows if row[bid_id] is not None]
+    content = dict(zip(beetl_fields, beetl))
+
+    # same parts as the etag of /bids, told apart from it
+    etag = make_etag('full', beetl_id, content['updated'], bids_total or 0, aggregate_updated or datetime.min)
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    content['bids_total'] = bids_total or 0
+    content['bids'] = bid_content(bids)
+    return ORJSONResponse(content, headers={'ETag': etag})
 
 @app.patch("/beetl", response_model=BeetlRead)
-async def patch_beetl(data: BeetlPatch):
+def patch_beetl(data: BeetlPatch, sessions: Sessions = Depends(get_sessions)):
 
-    beetl = _get_beetl(data.obfuscation, data.slug)
-    if beetl.secretkey == data.secretkey:
+    beetl_key = (data.obfuscation, data.slug)
 
-        with Session(engine) as session:
+    def update(session):
 
-            data = data.dict(exclude_unset=True)
+        beetl = _select_beetl(session, *beetl_key)
+        if not beetl or beetl.secretkey != data.secretkey:
+            raise HTTPException(status_code=404, detail="Beetl not found")
 
-            for key, value in data.items():
-                if key in Beetl._ignore_fields:
-                    continue
+        for key, value in data.dict(exclude_unset=True).items():
+            if key in Beetl._ignore_fields:
+                continue
 
-                setattr(beetl, key, value)
-            setattr(beetl, "updated", datetime.utcnow())
+            setattr(beetl, key, value)
+        setattr(beetl, "updated", datetime.utcnow())
 
-            session.add(beetl)
-            session.commit()
-            session.refresh(beetl)
+        session.add(beetl)
+        record_changes(session, [beetl_key])
+        return beetl
 
-            return beetl
+    def committed():
+        beetl_cache.invalidate(beetl_key)
+        bids_cache.invalidate(beetl_key)
+        _publish('beetl_updated', *beetl_key)
 
-    raise HTTPException(status_code=404, detail="Beetl not found")
+    beetl = _write(sessions(data.obfuscation), update)
+    sessions.on_commit(committed)
+
+    return beetl
 
 @app.delete('/beetl', response_model=BeetlDeleteResponse)
-async def delete_bid(obfuscation: str, slug: str, secretkey: str):
+def delete_beetl(obfuscation: str, slug: str, secretkey: str, sessions: Sessions = Depends(get_sessions)):
 
-    beetl = _get_beetl(obfuscation, slug)
-    if beetl.secretkey == secretkey:
+    def remove(session):
 
-        with Session(engine) as session:
+        beetl = _select_beetl(session, obfuscation, slug)
+        if not beetl or beetl.secretkey != secretkey:
+            raise HTTPException(status_code=404, detail="Beetl not found")
 
-            [session.delete(bid) for bid in session.exec(
-                select(Bid)
-                .where(Bid.beetl_obfuscation == obfuscation)
-                .where(Bid.beetl_slug == slug)
-            ).all()]
-            session.delete(beetl)
-            session.commit()
+        # one statement for all the bids, however many there are
+        bids_deleted = session.exec(delete(Bid).where(Bid.beetl_key == beetl.key)).rowcount
+        delete_aggregate(session, obfuscation, slug)
+        session.delete(beetl)
+        record_changes(session, [(obfuscation, slug)])
+        return {**beetl.dict(), 'bids_deleted': bids_deleted}
 
-        return beetl
+    def committed():
+        beetl_cache.invalidate((obfuscation, slug))
+        bids_cache.invalidate((obfuscation, slug))
+        hub.publish((obfuscation, slug), 'beetl_deleted', {})
 
-    raise HTTPException(status_code=404, detail="Beetl not found")
+    deleted = _write(sessions(obfuscation), remove)
+    sessions.on_commit(committed)
 
-@app.post("/bid", response_model=BidCreateRead)
-async def post_bid(data: BidCreate):
-    with Session(engine) as session:
-        bid = Bid.from_orm(data)
-        session.add(bid)
-        session.commit()
-        session.refresh(bid)
+    return deleted
 
-    return bid
+@app.post("/bid", response_model=BidCreateRead)
+def post_bid(data: BidCreate, sessions: Sessions = Depends(get_sessions)):
+
+    beetl_key = (data.beetl_obfuscation, data.beetl_slug)
+    beetl = _get_beetl(*beetl_key, sessions.reader(data.beetl_obfuscation))
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    bid = Bid.from_orm(data, update={'beetl_key': beetl.key})
+
+    def create(session):
+        if not session.execute(insert_bids, bid.dict()).rowcount:
+            raise HTTPException(status_code=404, detail="Beetl not found")
+        track_bid(session, *beetl_key, after=bid_values(bid))
+        record_changes(session, [beetl_key])
+
+    def committed():
+        bids_cache.invalidate(beetl_key)
+        _publish('bids_created', *beetl_key, [bid])
+
+    _write(sessions(data.beetl_obfuscation), create)
+    sessions.on_commit(committed)
+
+    return bid_dict(bid, *beetl_key)
+
+@app.post("/bids/batch", response_model=BidsBatchCreateRead)
+def post_bids_batch(
+        data: list[Any] = Body(..., max_items=1000),
+        sessions: Sessions = Depends(get_sessions),
+    ):
+
+    # every item is validated on its own, invalid ones (bids for beetls
+    # that don't exist too) are reported and skipped, all valid ones go in
+    # with a single insert (per shard)
+    results, bids, beetls = [], [], {}
+    for index, item in enumerate(data):
+
+        errors = [{'loc': [], 'msg': 'value is not a valid dict', 'type': 'type_error.dict'}]
+        if isinstance(item, dict):
+            try:
+                created = BidCreate.validate(item)
+                errors = None
+            except ValidationError as error:
+                errors = error.errors()
+
+        if not errors:
+            key = (created.beetl_obfuscation, created.beetl_slug)
+            if key not in beetls:
+                beetls[key] = _get_beetl(*key, sessions.reader(created.beetl_obfuscation))
+            if not beetls[key]:
+                errors = [beetl_not_found]
+
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+            continue
+
+        bid = Bid.from_orm(created, update={'beetl_key': beetls[key].key})
+        bids.append((key, bid))
+        results.append({'index': index, 'status': 'created', 'id': bid.id, 'secretkey': bid.secretkey})
+
+    # the bids of a beetl always share a shard
+    shards = {}
+    for key, bid in bids:
+        shard = shards.setdefault(engine_for(key[0]), {})
+        shard.setdefault(key, []).append(bid)
+
+    def create(beetls, session):
+
+        # leaves out the beetls deleted meanwhile, returns what went in
+        rows = [bid.dict() for group in beetls.values() for bid in group]
+        if session.execute(insert_bids, rows).rowcount < len(rows):
+            keys = [group[0].beetl_key for group in beetls.values()]
+            existing = set(session.exec(select(Beetl.key).where(Beetl.key.in_(keys))).all())
+            beetls = {key: group for key, group in beetls.items() if group[0].beetl_key in existing}
+
+        for (obfuscation, slug), group in beetls.items():
+            track_new_bids(session, obfuscation, slug, [bid_values(bid) for bid in group])
+        record_changes(session, beetls)
+        return beetls
+
+    def committed(beetls):
+        for (obfuscation, slug), group in beetls.items():
+            bids_cache.invalidate((obfuscation, slug))
+            _publish('bids_created', obfuscation, slug, group)
+
+    created = set()
+    for beetls in shards.values():
+        obfuscation, _ = next(iter(beetls))
+        beetls = _write(sessions(obfuscation), partial(create, beetls))
+        sessions.on_commit(partial(committed, beetls))
+        created.update(bid.id for group in beetls.values() for bid in group)
+
+    results = [
+        result if result['status'] != 'created' or result['id'] in created
+        else {'index': result['index'], 'status': 'invalid', 'errors': [beetl_not_found]}
+        for result in results
+    ]
+    return {'created': len(created), 'results': results}
 
 @app.get("/bids", response_model=BidsRead)
-async def get_bids(obfuscation: str, slug: str):
-    with Session(engine) as session:
-        bids = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == obfuscation)
-            .where(Bid.beetl_slug == slug)
-        ).all()
-        bids_total = len(bids)
+def get_bids(
+        obfuscation: str,
+        slug: str,
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        sort: Literal['created', 'min', 'max', 'name'] = 'created',
+        order: Literal['asc', 'desc'] = 'asc',
+        if_none_match: Optional[str] = Header(None),
+        sessions: Sessions = Depends(get_sessions),
+    ):
+
+    # the whole list in the default order is what viewers poll. it's kept
+    # encoded in bids_cache, so a hit needs neither the database nor json.
+    key = (obfuscation, slug)
+    cacheable = limit is None and cursor is None and sort == 'created' and order == 'asc'
+    if cacheable:
+        cached = bids_cache.get(key)
+        if cached:
+            etag, body = cached
+            if etag_matches(etag, if_none_match):
+                return not_modified(etag)
+            return Response(body, media_type='application/json', headers={'ETag': etag})
+        generation = bids_cache.generation
+
+    beetl = _get_beetl(obfuscation, slug, sessions(obfuscation))
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    session = sessions(obfuscation)
+    aggregate = get_aggregate(session, obfuscation, slug)
+    bids_total = aggregate.bids_count
+
+    # every bid write bumps the aggregate, beetlmode is in beetl.updated.
+    # pages and other orders are different responses, with their own tags
+    parts = [beetl.id, beetl.updated, bids_total, aggregate.updated]
+    if not cacheable:
+        parts += [sort, order, limit, cursor]
+    etag = make_etag(*parts)
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    if beetl.beetlmode == 'private':
+        content = {'bids_total': bids_total, 'bids': [], 'next_cursor': None}
+    else:
+        statement = (
+            select_bids()
+            .where(Beetl.obfuscation == obfuscation)
+            .where(Beetl.slug == slug)
+        )
+
+        try:
+            bids = session.exec(paginate(statement, sort, order, limit, cursor)).all()
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+
+        # without a limit everything comes in one go
+        next_cursor = None
+        if limit and len(bids) > limit:
+            bids = bids[:limit]
+            next_cursor = encode_cursor(sort, order, bids[-1])
+
+        content = {'bids_total': bids_total, 'bids': bid_content(bids), 'next_cursor': next_cursor}
+
+    response = ORJSONResponse(content, headers={'ETag': etag})
+    if cacheable:
+        bids_cache.set(key, (etag, response.body), generation)
+    return response
+
+@app.get("/bids/events", response_class=StreamingResponse)
+async def bid_events(obfuscation: str, slug: str):
+
+    # server-sent events: a `totals` event first, then bids_created,
+    # bids_updated, bids_deleted, beetl_updated, beetl_deleted and resync
+    beetl = await run_in_threadpool(_get_beetl, obfuscation, slug)
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    key = (obfuscation, slug)
+
+    async def stream():
+        with hub.subscribe(key) as subscription:
+            bids_total = await run_in_threadpool(_bids_total, obfuscation, slug)
+            yield server_sent_event('totals', json.dumps({'bids_total': bids_total}))
+
+            while True:
+                try:
+                    type, data = await asyncio.wait_for(subscription.get(), events_keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield server_sent_event(type, data)
+                if type == 'beetl_deleted':
+                    return
 
-        beetl = _get_beetl(obfuscation, slug)
+    return StreamingResponse(stream(), media_type='text/event-stream')
 
-        if beetl.beetlmode == 'public':
-            return {'bids': bids, 'bids_total': bids_total}
+@app.get("/bids/export", response_class=StreamingResponse)
+def export_bids(obfuscation: str, slug: str, format: Literal['ndjson', 'csv'] = 'ndjson'):
 
-        if beetl.beetlmode == 'private':
-            return {'bids': [], 'bids_total': bids_total}
+    beetl = _get_beetl(obfuscation, slug)
+    if not beetl:
+        raise HTTPException(status_code=404, detail="Beetl not found")
+
+    rows = exporters[format](obfuscation, slug, visible=beetl.beetlmode == 'public')
+    return StreamingResponse(
+        rows,
+        media_type=media_types[format],
+        headers={'Content-Disposition': f'attachment; filename="bids.{format}"'},
+    )
 
 @app.patch("/bid", response_model=BidRead)
-async def patch_bid(data: BidPatch):
-    with Session(engine) as session:
+def patch_bid(data: BidPatch, sessions: Sessions = Depends(get_sessions)):
+
+    beetl_key = (data.beetl_obfuscation, data.beetl_slug)
+
+    def update(session):
+
         bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == data.beetl_obfuscation)
-            .where(Bid.beetl_slug == data.beetl_slug)
+            select_bids(Bid)
+            .where(Beetl.obfuscation == data.beetl_obfuscation)
+            .where(Beetl.slug == data.beetl_slug)
             .where(Bid.secretkey == data.secretkey)
         ).first()
 
         if not bid:
             raise HTTPException(status_code=404, detail="bid not found")
 
-        data = data.dict(exclude_unset=True)
-
-        for key, value in data.items():
+        before = bid_values(bid)
+        for key, value in data.dict(exclude_unset=True).items():
             if key in Bid._ignore_fields:
                 continue
 
@@ -169,39 +743,65 @@ async def patch_bid(data: BidPatch):
 
         setattr(bid, "updated", datetime.utcnow())
         session.add(bid)
-        session.commit()
-        session.refresh(bid)
+        track_bid(session, *beetl_key, before, bid_values(bid))
+        record_changes(session, [beetl_key])
+        return bid
+
+    def committed():
+        bids_cache.invalidate(beetl_key)
+        _publish('bids_updated', *beetl_key, [bid])
+
+    bid = _write(sessions(data.beetl_obfuscation), update)
+    sessions.on_commit(committed)
 
-    return bid
+    return bid_dict(bid, *beetl_key)
 
 @app.delete('/bid', response_model=BidDeleteResponse)
-async def delete_bid(beetl_obfuscation: str, beetl_slug: str, secretkey: str):
+def delete_bid(
+        beetl_obfuscation: str,
+        beetl_slug: str,
+        secretkey: str,
+        sessions: Sessions = Depends(get_sessions),
+    ):
+
+    def remove(session):
 
-    with Session(engine) as session:
         bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == beetl_obfuscation)
-            .where(Bid.beetl_slug == beetl_slug)
+            select_bids(Bid)
+            .where(Beetl.obfuscation == beetl_obfuscation)
+            .where(Beetl.slug == beetl_slug)
             .where(Bid.secretkey == secretkey)
         ).first()
 
-        if bid:
-            session.delete(bid)
-            session.commit()
+        if not bid:
+            raise HTTPException(status_code=404, detail="Bid not found")
 
-            return bid
+        session.delete(bid)
+        track_bid(session, beetl_obfuscation, beetl_slug, before=bid_values(bid))
+        record_changes(session, [(beetl_obfuscation, beetl_slug)])
+        return bid
 
-    raise HTTPException(status_code=404, detail="Bid not found")
+    def committed():
+        bids_cache.invalidate((beetl_obfuscation, beetl_slug))
+        _publish('bids_deleted', beetl_obfuscation, beetl_slug, [bid])
+
+    bid = _write(sessions(beetl_obfuscation), remove)
+    sessions.on_commit(committed)
+
+    return bid_dict(bid, beetl_obfuscation, beetl_slug)
 
 @app.post("/checksecretkey", response_model=BidCheckSecretKeyResponse)
-async def check_secretkey(data: BidCheckSecretKey):
-    with Session(engine) as session:
+@read_only
+def check_secretkey(data: BidCheckSecretKey, sessions: Sessions = Depends(get_sessions)):
+
+    # the id alone doesn't tell the shard, so ask all of them
+    for session in sessions.every_shard():
         bid = session.exec(
             select(Bid)
             .where(Bid.id == data.id)
             .where(Bid.secretkey == data.secretkey)
         ).first()
 
-    if bid:
-        return {'status':'success'}
+        if bid:
+            return {'status':'success'}
     return {'status':'failed'}
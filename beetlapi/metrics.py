@@ -0,0 +1,219 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.routing import Match
+from threading import Lock
+import time
+
+# request and query metrics in the prometheus text format, kept in process.
+#
+# the middleware puts the matched route into `current_route`. handlers run
+# on the threadpool with a copy of the request context, so the engine hooks
+# see it too and queries are counted per route. queries outside of requests
+# (startup, retention) count as route "".
+
+current_route = ContextVar('current_route', default='')
+
+latency_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = latency_buckets):
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (+inf last), sum]
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels):
+
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def count(self, *labels) -> int:
+        counts, _ = self._values.get(labels, ((), 0))
+        return sum(counts)
+
+    def render(self) -> list:
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = _labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Collected:
+
+    # values kept elsewhere (e.g. cache counters), read when rendering.
+    # `collect` returns {label values: value}.
+
+    def __init__(self, name: str, help: str, type: str, labels: tuple, collect):
+
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> list:
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+requests_total = Counter(
+    'beetl_http_requests_total', 'HTTP requests by route, method and status.',
+    ('route', 'method', 'status'),
+)
+request_seconds = Histogram(
+    'beetl_http_request_duration_seconds', 'HTTP request latency by route and method.',
+    ('route', 'method'),
+)
+queries_total = Counter(
+    'beetl_db_queries_total', 'SQL statements by statement type and route.',
+    ('statement', 'route'),
+)
+query_seconds = Histogram(
+    'beetl_db_query_duration_seconds', 'SQL statement latency by statement type and route.',
+    ('statement', 'route'),
+)
+
+registry = [requests_total, request_seconds, queries_total, query_seconds]
+
+
+def render() -> str:
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+def statement_type(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    labels = (statement_type(statement), current_route.get())
+    queries_total.inc(*labels)
+    query_seconds.observe(elapsed, *labels)
+
+
+def _handle_error(context):
+
+    # a failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get('query_start') if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument(engine):
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+class MetricsMiddleware:
+
+    # plain asgi, so streaming responses pass through untouched. routes are
+    # recorded by their path template, anything unmatched as "unmatched" to
+    # keep the number of label values bounded.
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope) -> str:
+
+        # a partial match is a known path with the wrong method
+        partial = 'unmatched'
+        for route in scope['app'].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial == 'unmatched':
+                partial = route.path
+        return partial
+
+    async def __call__(self, scope, receive, send):
+
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        route = self._route(scope)
+        method = scope['method']
+        status = 500
+        token = current_route.set(route)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_seconds.observe(time.perf_counter() - start, route, method)
+            requests_total.inc(route, method, str(status))
+            current_route.reset(token)
@@ -0,0 +1,80 @@
+from beetlapi.database.main import Bid
+from datetime import datetime
+from sqlalchemy import literal, tuple_
+import base64
+import json
+import uuid
+
+# keyset pagination over the bids of a beetl. pages are ordered by the sort
+# column and the id as tie breaker, the cursor is the position of the last
+# bid of a page. both are served by the ix_bid_beetl_<sort> indexes.
+
+
+def encode_cursor(sort: str, order: str, bid) -> str:
+
+    value = getattr(bid, sort)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    payload = json.dumps([sort, order, value, bid.id.hex]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+# what the values of each sort look like in a cursor
+cursor_types = {'created': str, 'name': str, 'min': int, 'max': int}
+
+
+def decode_cursor(cursor: str, sort: str, order: str):
+
+    # cursors come from clients, anything not made by encode_cursor is a
+    # ValueError
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+    if not isinstance(payload, list) or len(payload) != 4:
+        raise ValueError("invalid cursor")
+
+    cursor_sort, cursor_order, value, id = payload
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("cursor belongs to another sort order")
+
+    # bool is an int to python, not to the cursor
+    if not isinstance(id, str) or not isinstance(value, cursor_types[sort]) or isinstance(value, bool):
+        raise ValueError("invalid cursor")
+
+    try:
+        id = uuid.UUID(id)
+        if sort == 'created':
+            value = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("invalid cursor")
+
+    return value, id
+
+
+def paginate(statement, sort: str, order: str, limit: int = None, cursor: str = None):
+
+    # fetches one more than `limit` to know whether there is a next page
+    column = getattr(Bid, sort)
+
+    if cursor:
+        value, id = decode_cursor(cursor, sort, order)
+        # row values let sqlite seek right to the cursor in the index
+        position = tuple_(column, Bid.id)
+        cursor = tuple_(literal(value, column.type), literal(id, Bid.id.type))
+        if order == 'asc':
+            statement = statement.where(position > cursor)
+        else:
+            statement = statement.where(position < cursor)
+
+    if order == 'asc':
+        statement = statement.order_by(column.asc(), Bid.id.asc())
+    else:
+        statement = statement.order_by(column.desc(), Bid.id.desc())
+
+    if limit:
+        statement = statement.limit(limit + 1)
+    return statement
@@ -0,0 +1,63 @@
+from beetlapi.database.main import Beetl, Bid
+from beetlapi.database.models import BeetlRead, BidRead, SettlementRead
+from sqlmodel import select
+from typing import Iterable
+
+# the hot read endpoints skip fastapi's response_model round trip (validate
+# every bid into a model, jsonable_encoder, json.dumps) and encode plain
+# dicts built from row tuples with orjson. their response_model stays for
+# the openapi schema, the output is the same: field order included, uuids
+# with dashes and naive datetimes in isoformat. a returned response skips
+# the injected `response` as well, headers have to be passed to it.
+
+beetl_fields = tuple(BeetlRead.__fields__)
+bid_fields = tuple(BidRead.__fields__)
+settlement_fields = tuple(SettlementRead.__fields__)
+# pydantic made floats of these, round() may have left ints
+settlement_floats = tuple(field for field, info in SettlementRead.__fields__.items() if info.outer_type_ is float)
+
+# bids refer to their beetl by Beetl.key, its obfuscation and slug come
+# from joining the beetl. select(*bid_columns) yields rows in bid_fields
+# order, same for beetls.
+joined_bid_columns = {'beetl_obfuscation': Beetl.obfuscation, 'beetl_slug': Beetl.slug}
+
+
+def bid_column(field: str):
+    return joined_bid_columns[field] if field in joined_bid_columns else getattr(Bid, field)
+
+
+bid_columns = tuple(bid_column(field) for field in bid_fields)
+beetl_columns = tuple(getattr(Beetl, field) for field in beetl_fields)
+
+
+def select_bids(*columns):
+
+    # the bids joined with their beetl, filter on Beetl.obfuscation and slug
+    return select(*(columns or bid_columns)).join(Beetl, Beetl.key == Bid.beetl_key)
+
+
+def beetl_content(beetl) -> dict:
+    return {field: getattr(beetl, field) for field in beetl_fields}
+
+
+def bid_content(rows) -> list:
+    return [dict(zip(bid_fields, row)) for row in rows]
+
+
+def bid_dict(bid: Bid, obfuscation: str, slug: str) -> dict:
+
+    # a Bid with what it doesn't store, for BidRead and the like
+    return {**bid.dict(exclude={'beetl_key'}), 'beetl_obfuscation': obfuscation, 'beetl_slug': slug}
+
+
+def settlement_content(settlement: dict, contributions: Iterable) -> dict:
+
+    # what settle() returns, contributions as (id, name, amount) tuples
+    content = {field: settlement.get(field) for field in settlement_fields}
+    for field in settlement_floats:
+        content[field] = float(content[field])
+    content['contributions'] = [
+        {'id': id, 'name': name, 'amount': float(amount)}
+        for id, name, amount in contributions
+    ]
+    return content
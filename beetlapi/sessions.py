@@ -0,0 +1,116 @@
+from beetlapi.database.main import all_engines, engine_for
+from fastapi import Request
+from fastapi.routing import APIRoute
+from functools import wraps
+from sqlmodel import Session
+import asyncio
+
+# the unit of work of a request, from the `get_sessions` dependency.
+# GET and HEAD requests, and endpoints marked @read_only, get sessions on
+# the read-only engines, everything else on the writers. a request gets at
+# most one session per shard, opened when first asked for. helpers are
+# handed that session instead of opening their own and never commit.
+#
+# UnitOfWorkRoute commits once the endpoint returned, on the thread that
+# ran it, then runs what was registered with on_commit (invalidating
+# caches, publishing events). when the endpoint raises nothing commits,
+# closing the sessions rolls back. shards commit one after the other.
+#
+# the writer of a shard is a single connection. a request holding it must
+# not wait for another thread to give it back: with more writes in flight
+# than threads, all of them may be waiting for that connection.
+
+
+def read_only(endpoint):
+    endpoint.read_only = True
+    return endpoint
+
+
+class Sessions:
+
+    def __init__(self, read_only: bool):
+
+        self.read_only = read_only
+        self._sessions = {}
+        self._on_commit = []
+
+    def __call__(self, obfuscation: str) -> Session:
+        return self._session(engine_for(obfuscation, self.read_only))
+
+    def reader(self, obfuscation: str) -> Session:
+
+        # for reads outside of the writes of a write request. holding on to
+        # the writer (a single connection) would block the group commit.
+        return self._session(engine_for(obfuscation, read_only=True))
+
+    def every_shard(self) -> list:
+        return [self._session(engine) for engine in all_engines(self.read_only)]
+
+    def _session(self, engine) -> Session:
+
+        if engine not in self._sessions:
+            self._sessions[engine] = Session(engine, expire_on_commit=False)
+        return self._sessions[engine]
+
+    def on_commit(self, callback):
+        self._on_commit.append(callback)
+
+    def commit(self):
+
+        if not self.read_only:
+            for session in self._sessions.values():
+                session.commit()
+        self.close()
+
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+def get_sessions(request: Request):
+
+    endpoint = request.scope.get('endpoint')
+    sessions = Sessions(request.method in ('GET', 'HEAD') or getattr(endpoint, 'read_only', False))
+    request.state.sessions = sessions
+    try:
+        yield sessions
+    finally:
+        # fastapi gets here after the response is sent, too late to commit
+        sessions.close()
+
+
+def unit_of_work(endpoint):
+
+    # fastapi goes by the signature of the endpoint, @wraps keeps it
+    @wraps(endpoint)
+    def committing(*args, **kwargs):
+
+        sessions = [value for value in kwargs.values() if isinstance(value, Sessions)]
+        try:
+            result = endpoint(*args, **kwargs)
+        except BaseException:
+            for each in sessions:
+                each.close()
+            raise
+
+        for each in sessions:
+            each.commit()
+        return result
+
+    return committing
+
+
+class UnitOfWorkRoute(APIRoute):
+
+    def __init__(self, path: str, endpoint, **kwargs):
+
+        # async endpoints don't get sessions
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = unit_of_work(endpoint)
+        super().__init__(path, endpoint, **kwargs)
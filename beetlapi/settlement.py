@@ -0,0 +1,97 @@
+from typing import Optional, Sequence
+
+# How much everyone pays to reach the target of a beetl.
+#
+# percentage: everyone pays the same share of the range between their
+#     min and max.
+# stepwise: first everyone goes up from min towards mid by the same share,
+#     only when all mids are not enough the range from mid to max is used.
+#
+# Without a mid, stepwise goes straight from min to max in its second step.
+#
+# Both have a closed form over the sums of the bids: the share (`factor`)
+# only depends on the totals, which are kept in the beetl aggregates, and
+# every bidders amount is then one linear pass over the bids.
+
+methods = ('percentage', 'stepwise')
+
+
+def effective_mids(mins: Sequence[int], mids: Sequence[Optional[int]]) -> list[int]:
+    return [min if mid is None else mid for min, mid in zip(mins, mids)]
+
+
+def settle_totals(
+        method: str,
+        target: Optional[int],
+        total_min: int,
+        total_mid: int,
+        total_max: int,
+    ) -> dict:
+
+    if method not in methods:
+        raise ValueError(f"unknown method: {method}")
+
+    step, factor, total = 0, 0.0, total_min
+    if target is None or target <= total_min:
+        pass
+    elif target >= total_max:
+        step = 1 if method == 'percentage' else 2
+        factor, total = 1.0, total_max
+    elif method == 'percentage':
+        step, total = 1, target
+        factor = (target - total_min) / (total_max - total_min)
+    elif target <= total_mid:
+        step, total = 1, target
+        factor = (target - total_min) / (total_mid - total_min)
+    else:
+        step, total = 2, target
+        factor = (target - total_mid) / (total_max - total_mid)
+
+    if target is None:
+        status = 'no_target'
+    elif total_max >= target:
+        status = 'covered'
+    else:
+        status = 'not_covered'
+
+    return {
+        'method': method,
+        'target': target,
+        'status': status,
+        'step': step,
+        'factor': factor,
+        'total': round(total, 2),
+        'total_min': total_min,
+        'total_mid': total_mid,
+        'total_max': total_max,
+        'shortfall': round(max(0, (target or 0) - total), 2),
+    }
+
+
+def amounts(settlement: dict, mins: Sequence[int], mids: Sequence[int], maxs: Sequence[int]) -> list[float]:
+
+    # `mids` have to be effective mids already
+    step, factor = settlement['step'], settlement['factor']
+    if step == 0:
+        return list(mins)
+
+    if step == 1:
+        lows, highs = mins, maxs if settlement['method'] == 'percentage' else mids
+    else:
+        lows, highs = mids, maxs
+
+    return [round(low + factor * (high - low), 2) for low, high in zip(lows, highs)]
+
+
+def settle(
+        method: str,
+        target: Optional[int],
+        mins: Sequence[int],
+        mids: Sequence[Optional[int]],
+        maxs: Sequence[int],
+    ) -> dict:
+
+    mids = effective_mids(mins, mids)
+    settlement = settle_totals(method, target, sum(mins), sum(mids), sum(maxs))
+    settlement['amounts'] = amounts(settlement, mins, mids, maxs)
+    return settlement
@@ -0,0 +1,118 @@
+from beetlapi.metrics import current_route
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+import json
+import logging
+import time
+
+# statements slower than a threshold are logged as one json object per line
+# together with sqlite's query plan, to see whether they used an index.
+#
+# parameters bound to secret keys are replaced by `redacted`. parameters of
+# statements not compiled by sqlalchemy have no names, they're all redacted.
+
+logger = logging.getLogger(__name__)
+logger.propagate = False
+
+redacted = '<redacted>'
+secret_names = ('secretkey',)
+explained = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record) -> str:
+        return json.dumps(record.msg, default=str)
+
+
+def _names(context, count: int) -> list:
+
+    compiled = getattr(context, 'compiled', None)
+    names = getattr(compiled, 'positiontup', None)
+    if not names or len(names) != count:
+        return [None] * count
+    return names
+
+
+def redact(context, parameters) -> list:
+
+    if isinstance(parameters, dict):
+        return {
+            name: redacted if any(secret in name for secret in secret_names) else value
+            for name, value in parameters.items()
+        }
+
+    parameters = list(parameters)
+    names = _names(context, len(parameters))
+    return [
+        redacted if name is None or any(secret in name for secret in secret_names) else value
+        for name, value in zip(names, parameters)
+    ]
+
+
+def explain(cursor, statement: str, parameters) -> list:
+
+    if statement.split(None, 1)[0].upper() not in explained:
+        return []
+    try:
+        plan = cursor.connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return [row[-1] for row in plan.fetchall()]
+    except Exception as error:
+        return [f'explain failed: {error}']
+
+
+class SlowQueryLog:
+
+    def __init__(self, threshold: float):
+
+        # seconds
+        self.threshold = threshold
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slowlog_start', []).append(time.perf_counter())
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+
+        elapsed = time.perf_counter() - conn.info['slowlog_start'].pop()
+        if elapsed < self.threshold:
+            return
+
+        # an executemany is explained and logged by its first row
+        first = parameters[0] if executemany and parameters else parameters
+        logger.warning({
+            'time': datetime.utcnow().isoformat(),
+            'route': current_route.get(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'statement': statement,
+            'parameters': redact(context, first),
+            'rows': len(parameters) if executemany else 1,
+            'plan': explain(cursor, statement, first),
+        })
+
+    def error(self, context):
+        starts = context.connection.info.get('slowlog_start') if context.connection else None
+        if starts:
+            starts.pop()
+
+
+def enable(engine, threshold: float, path: str, max_bytes: int = 10_000_000, backups: int = 5) -> SlowQueryLog:
+
+    if not any(isinstance(handler, RotatingFileHandler) for handler in logger.handlers):
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(JSONFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+
+    log = SlowQueryLog(threshold)
+    event.listen(engine, 'before_cursor_execute', log.before)
+    event.listen(engine, 'after_cursor_execute', log.after)
+    event.listen(engine, 'handle_error', log.error)
+    return log
+
+
+def disable(engine, log: SlowQueryLog):
+
+    event.remove(engine, 'before_cursor_execute', log.before)
+    event.remove(engine, 'after_cursor_execute', log.after)
+    event.remove(engine, 'handle_error', log.error)
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# shared by the benchmarks: import paths, a throwaway database and a local
+# uvicorn to run against. import this before anything from beetlapi.
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [root, os.path.join(root, 'test')]
+os.environ.setdefault(
+    'BEETL_DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db')
+)
+
+import httpx
+
+
+def serve(app: str, port: int, app_factory: bool = False) -> subprocess.Popen:
+
+    command = [
+        sys.executable, '-m', 'uvicorn', app, '--port', str(port),
+        '--log-level', 'warning', '--app-dir', os.path.dirname(__file__),
+    ]
+    if app_factory:
+        command.append('--factory')
+    server = subprocess.Popen(command, cwd=root, env=os.environ)
+
+    for _ in range(100):
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/api/docs')
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f'{app} did not come up')
+
+
+def stop(server: subprocess.Popen):
+
+    server.terminate()
+    server.wait()
+
+
+def percentile(values: list, p: float) -> float:
+
+    # nearest rank, `values` sorted
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
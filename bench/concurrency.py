@@ -0,0 +1,143 @@
+"""
+Compares the threadpool handlers against the previous setup where the very
+same handlers ran as `async def` directly on the event loop.
+
+    python bench/concurrency.py --bids 200 --concurrency 32 --seconds 5
+
+`--concurrency` clients keep firing a mix of `GET /beetl`, `GET /bids` and
+`POST /bid` at a local uvicorn for `--seconds`. On the event loop any query
+stalls every other request, on the threadpool they overlap wherever sqlite
+waits on the disk or a lock, so the gain grows with the storage latency.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from common import percentile, serve, stop
+import httpx
+from fastapi import FastAPI
+from sqlmodel import Session
+
+from beetlapi import main
+from beetlapi.sessions import Sessions
+from beetlapi.database.main import (
+    Beetl, Bid, BidCreate, create_db_and_tables, engine, sqlite_file_name
+)
+import factory
+
+
+def seed(amount: int):
+
+    create_db_and_tables()
+    beetl = factory.beetl(beetlmode='public')
+    with Session(engine) as session:
+        stored = Beetl(**beetl)
+        session.add(stored)
+        session.flush()
+        for _ in range(amount):
+            session.add(Bid(**factory.bid(beetl['obfuscation'], beetl['slug']), beetl_key=stored.key))
+        session.commit()
+    return beetl
+
+
+def _unit_of_work(handler, read_only: bool, *args, **kwargs):
+
+    # what the route does around the handler
+    sessions = Sessions(read_only)
+    try:
+        result = handler(*args, sessions=sessions, **kwargs)
+        sessions.commit()
+        return result
+    finally:
+        sessions.close()
+
+
+def blocking_app() -> FastAPI:
+
+    # the handlers as they were before: async, blocking the loop
+    app = FastAPI()
+
+    @app.get('/beetl')
+    async def get_beetl(obfuscation: str, slug: str):
+        return _unit_of_work(main.get_beetl, True, obfuscation, slug, if_none_match=None)
+
+    @app.get('/bids')
+    async def get_bids(obfuscation: str, slug: str):
+        return _unit_of_work(
+            main.get_bids, True, obfuscation, slug,
+            limit=None, cursor=None, sort='created', order='asc', if_none_match=None,
+        )
+
+    @app.post('/bid')
+    async def post_bid(data: BidCreate):
+        return _unit_of_work(main.post_bid, False, data)
+
+    return app
+
+
+async def run(app: str, beetl: dict, args, app_factory: bool = False) -> dict:
+
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    latencies = {'GET /beetl': [], 'GET /bids': [], 'POST /bid': []}
+
+    server = serve(app, args.port, app_factory)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{args.port}', limits=limits)
+    try:
+        async def request(endpoint):
+            if endpoint == 'POST /bid':
+                bid = factory.bid(beetl['obfuscation'], beetl['slug'])
+                return await client.post('/bid', json=bid)
+            return await client.get(endpoint.split()[1], params=params)
+
+        async def worker(deadline):
+            while time.perf_counter() < deadline:
+                endpoint = random.choice(list(latencies))
+                start = time.perf_counter()
+                response = await request(endpoint)
+                assert response.status_code == 200, response.text
+                latencies[endpoint].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(start + args.seconds) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.aclose()
+        stop(server)
+
+    result = {'rps': sum(len(l) for l in latencies.values()) / elapsed}
+    for endpoint, values in latencies.items():
+        values.sort()
+        result[endpoint] = (percentile(values, 50) * 1000, percentile(values, 99) * 1000)
+    return result
+
+
+async def bench(args):
+
+    results = {}
+    for name, app, app_factory in [
+        ('event loop (before)', 'concurrency:blocking_app', True),
+        ('threadpool', 'beetlapi:app', False),
+    ]:
+        # same amount of bids for both runs
+        engine.dispose()
+        if os.path.exists(sqlite_file_name):
+            os.remove(sqlite_file_name)
+        beetl = seed(args.bids)
+        results[name] = await run(app, beetl, args, app_factory)
+
+    for name, result in results.items():
+        print(f"{name:<20} {result.pop('rps'):7.0f} req/s")
+        for endpoint, (p50, p99) in result.items():
+            print(f"    {endpoint:<12} p50 {p50:7.1f}ms  p99 {p99:7.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bids', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    asyncio.run(bench(parser.parse_args()))
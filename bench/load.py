@@ -0,0 +1,282 @@
+"""
+Load test for every endpoint against a local uvicorn.
+
+    python bench/load.py --beetls 50 --bids 200 --requests 500 --concurrency 16 \
+        --output bench/results.json [--baseline bench/baseline.json]
+
+Seeds a throwaway database (or `BEETL_DATABASE`) with `--beetls` beetls of
+`--bids` bids each, then drives one endpoint after the other with
+`--concurrency` clients for `--requests` requests. Reports throughput and
+p50/p95/p99 latency per endpoint and writes them to `--output`.
+
+With `--baseline` every endpoint is compared against an earlier output: if
+its p95 grew or its throughput shrank by more than `--tolerance`, that is
+reported as a regression and the exit code is 1.
+
+/bids/events is left out, its requests never finish.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from common import percentile, root, serve, stop
+import httpx
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from beetlapi.database.aggregates import rebuild_aggregates
+from beetlapi.database.main import Beetl, Bid, create_db_and_tables, engine_for, engines
+from beetlapi.serialization import bid_dict
+import factory
+
+
+def seed(beetls: int, bids: int) -> list:
+
+    # everything needed to address and edit the seeded data later
+    create_db_and_tables()
+    seeded = []
+    for i in range(beetls):
+        beetl = Beetl(**factory.beetl(slug=f'beetl-{i}', beetlmode=random.choice(['public', 'private'])))
+        with Session(engine_for(beetl.obfuscation)) as session:
+            session.add(beetl)
+            session.flush()
+            rows = [Bid(**factory.bid(beetl.obfuscation, beetl.slug), beetl_key=beetl.key) for _ in range(bids)]
+            if rows:
+                session.execute(insert(Bid), [row.dict() for row in rows])
+            seeded.append({
+                'beetl': beetl.dict(exclude={'key'}),
+                'bids': [bid_dict(row, beetl.obfuscation, beetl.slug) for row in rows],
+            })
+            session.commit()
+
+    for engine in engines:
+        with engine.begin() as connection:
+            rebuild_aggregates(connection)
+
+    return json.loads(json.dumps(seeded, default=str))
+
+
+class Scenarios:
+
+    # one method per endpoint, each measures exactly one request. requests
+    # that only prepare it (e.g. creating what gets deleted) aren't measured.
+
+    def __init__(self, client: httpx.AsyncClient, seeded: list):
+
+        self.client = client
+        self.seeded = seeded
+
+    def _pick(self):
+
+        entry = random.choice(self.seeded)
+        beetl = entry['beetl']
+        return entry, {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    def _new_bid(self, beetl: dict) -> dict:
+        return factory.bid(beetl['obfuscation'], beetl['slug'])
+
+    async def post_beetl(self, measure):
+        await measure(self.client.post('/beetl', json=factory.beetl()))
+
+    async def get_beetl(self, measure):
+        await measure(self.client.get('/beetl', params=self._pick()[1]))
+
+    async def get_beetl_full(self, measure):
+        await measure(self.client.get('/beetl/full', params=self._pick()[1]))
+
+    async def get_settlement(self, measure):
+        await measure(self.client.get('/beetl/settlement', params=self._pick()[1]))
+
+    async def patch_beetl(self, measure):
+        entry, _ = self._pick()
+        beetl = {**entry['beetl'], 'title': f'title {random.random()}'}
+        for key in ['id', 'created', 'updated']:
+            beetl.pop(key)
+        await measure(self.client.patch('/beetl', json=beetl))
+
+    async def delete_beetl(self, measure):
+        beetl = factory.beetl()
+        secretkey = (await self.client.post('/beetl', json=beetl)).json()['secretkey']
+        await self.client.post('/bids/batch', json=[self._new_bid(beetl) for _ in range(20)])
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug'], 'secretkey': secretkey}
+        await measure(self.client.delete('/beetl', params=params))
+
+    async def post_bid(self, measure):
+        entry, _ = self._pick()
+        await measure(self.client.post('/bid', json=self._new_bid(entry['beetl'])))
+
+    async def post_bids_batch(self, measure):
+        entry, _ = self._pick()
+        bids = [self._new_bid(entry['beetl']) for _ in range(50)]
+        await measure(self.client.post('/bids/batch', json=bids))
+
+    async def get_bids(self, measure):
+        await measure(self.client.get('/bids', params=self._pick()[1]))
+
+    async def get_bids_page(self, measure):
+        params = {**self._pick()[1], 'limit': 50, 'sort': random.choice(['created', 'min', 'max', 'name'])}
+        await measure(self.client.get('/bids', params=params))
+
+    async def export_bids(self, measure):
+        params = {**self._pick()[1], 'format': random.choice(['ndjson', 'csv'])}
+        await measure(self.client.get('/bids/export', params=params))
+
+    async def patch_bid(self, measure):
+        entry, _ = self._pick()
+        if not entry['bids']:
+            return await self.post_bid(measure)
+        bid = {**random.choice(entry['bids']), 'name': f'name {random.random()}'}
+        await measure(self.client.patch('/bid', json=bid))
+
+    async def delete_bid(self, measure):
+        entry, _ = self._pick()
+        bid = (await self.client.post('/bid', json=self._new_bid(entry['beetl']))).json()
+        params = {
+            'beetl_obfuscation': bid['beetl_obfuscation'],
+            'beetl_slug': bid['beetl_slug'],
+            'secretkey': bid['secretkey'],
+        }
+        await measure(self.client.delete('/bid', params=params))
+
+    async def check_secretkey(self, measure):
+        entry, _ = self._pick()
+        if not entry['bids']:
+            return await self.post_bid(measure)
+        bid = random.choice(entry['bids'])
+        await measure(self.client.post('/checksecretkey', json={'id': bid['id'], 'secretkey': bid['secretkey']}))
+
+
+endpoints = {
+    'POST /beetl': Scenarios.post_beetl,
+    'GET /beetl': Scenarios.get_beetl,
+    'GET /beetl/full': Scenarios.get_beetl_full,
+    'GET /beetl/settlement': Scenarios.get_settlement,
+    'PATCH /beetl': Scenarios.patch_beetl,
+    'DELETE /beetl': Scenarios.delete_beetl,
+    'POST /bid': Scenarios.post_bid,
+    'POST /bids/batch': Scenarios.post_bids_batch,
+    'GET /bids': Scenarios.get_bids,
+    'GET /bids?limit': Scenarios.get_bids_page,
+    'GET /bids/export': Scenarios.export_bids,
+    'PATCH /bid': Scenarios.patch_bid,
+    'DELETE /bid': Scenarios.delete_bid,
+    'POST /checksecretkey': Scenarios.check_secretkey,
+}
+
+
+async def drive(scenarios: Scenarios, scenario, requests: int, concurrency: int) -> dict:
+
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def measure(request):
+        nonlocal errors
+        start = time.perf_counter()
+        response = await request
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await scenario(scenarios, measure)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+
+    regressions = []
+    for endpoint, before in baseline['endpoints'].items():
+        now = results['endpoints'].get(endpoint)
+        if not now:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']:.1f}ms -> {now['p95_ms']:.1f}ms")
+        if now['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: {before['rps']:.0f} -> {now['rps']:.0f} req/s")
+    return regressions
+
+
+def git_revision() -> str:
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+async def main(args) -> int:
+
+    seeded = seed(args.beetls, args.bids)
+    server = serve('beetlapi:app', args.port)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{args.port}', limits=limits, timeout=60)
+
+    results = {
+        'created': datetime.utcnow().isoformat(),
+        'revision': git_revision(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'endpoints': {},
+    }
+    try:
+        scenarios = Scenarios(client, seeded)
+        for endpoint, scenario in endpoints.items():
+            if args.only and endpoint not in args.only:
+                continue
+            result = await drive(scenarios, scenario, args.requests, args.concurrency)
+            results['endpoints'][endpoint] = result
+            print(
+                f"{endpoint:<24} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f}ms  "
+                f"p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms  errors {result['errors']}"
+            )
+    finally:
+        await client.aclose()
+        stop(server)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--beetls', type=int, default=50)
+    parser.add_argument('--bids', type=int, default=200, help='bids per beetl')
+    parser.add_argument('--requests', type=int, default=500, help='per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--only', nargs='*', help='endpoints to run, e.g. "GET /bids"')
+    parser.add_argument('--output', default='bench/results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    sys.exit(asyncio.run(main(parser.parse_args())))
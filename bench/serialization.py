@@ -0,0 +1,108 @@
+"""
+CPU time per bid of GET /bids: the response_model path against the orjson
+path from beetlapi/serialization.py.
+
+    python bench/serialization.py --bids 10 100 1000 5000 --repeat 20
+
+Both fetch the bids of one beetl and encode the body. `response_model` is
+what fastapi did before: ORM objects, validated into BidsRead by the route's
+own response field, jsonable_encoder and json.dumps. `orjson` is what the
+handler does now: row tuples into dicts into orjson.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import common  # paths and a throwaway database, before beetlapi
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from beetlapi import app
+from beetlapi.database.main import Beetl, Bid, create_db_and_tables, engine
+from beetlapi.serialization import bid_content, bid_dict, select_bids
+import factory
+
+
+def seed(amount: int) -> dict:
+
+    beetl = factory.beetl(beetlmode='public')
+    with Session(engine) as session:
+        stored = Beetl(**beetl)
+        session.add(stored)
+        session.flush()
+        bids = [
+            Bid(**factory.bid(beetl['obfuscation'], beetl['slug']), beetl_key=stored.key).dict()
+            for _ in range(amount)
+        ]
+        if bids:
+            session.execute(insert(Bid), bids)
+        session.commit()
+    return beetl
+
+
+def _where(statement, beetl: dict):
+    return (
+        statement
+        .where(Beetl.obfuscation == beetl['obfuscation'])
+        .where(Beetl.slug == beetl['slug'])
+        .order_by(Bid.created, Bid.id)
+    )
+
+
+async def response_model(beetl: dict, field) -> bytes:
+
+    with Session(engine) as session:
+        bids = session.exec(_where(select_bids(Bid), beetl)).all()
+        bids = [bid_dict(bid, beetl['obfuscation'], beetl['slug']) for bid in bids]
+        content = {'bids': bids, 'bids_total': len(bids), 'next_cursor': None}
+        content = await serialize_response(field=field, response_content=content, is_coroutine=True)
+    return json.dumps(jsonable_encoder(content)).encode()
+
+
+async def orjson(beetl: dict, field) -> bytes:
+
+    with Session(engine) as session:
+        rows = session.exec(_where(select_bids(), beetl)).all()
+    content = {'bids_total': len(rows), 'bids': bid_content(rows), 'next_cursor': None}
+    return ORJSONResponse(content).body
+
+
+async def measure(path, beetl: dict, field, repeat: int) -> float:
+
+    # best of `repeat`, process time so other load on the machine is left out
+    await path(beetl, field)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        await path(beetl, field)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+async def main(args):
+
+    create_db_and_tables()
+    route = next(route for route in app.routes if getattr(route, 'path', None) == '/bids')
+    field = route.secure_cloned_response_field
+
+    print(f"{'bids':>6} {'response_model':>16} {'orjson':>10} {'saved':>10} {'speedup':>8}")
+    for amount in args.bids:
+        beetl = seed(amount)
+        before = await measure(response_model, beetl, field, args.repeat)
+        after = await measure(orjson, beetl, field, args.repeat)
+        per_bid = lambda seconds: seconds / max(amount, 1) * 1e6
+        print(
+            f"{amount:>6} {per_bid(before):>13.1f}µs {per_bid(after):>8.1f}µs "
+            f"{per_bid(before - after):>8.1f}µs {before / after:>7.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bids', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,127 @@
+"""
+Size of the database before and after the compact storage migration, per
+table and index.
+
+    python bench/storage.py --beetls 200 --bids 500
+
+Builds a database in the layout before the migration (uuids as 32 hex
+characters, timestamps as iso text, the obfuscation and slug of the beetl in
+every bid), runs the migrations on a copy of it and vacuums both. Sizes come
+from sqlite's dbstat table, in bytes of pages in use.
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import uuid
+
+import common  # paths and a throwaway database, before beetlapi
+
+from beetlapi.database.main import create_shard_engine
+from beetlapi.database.migrations import migrate
+import factory
+
+# what create_all and the migrations up to _add_sort_indexes made
+old_schema = [
+    "CREATE TABLE beetl (id CHAR(32) NOT NULL, secretkey VARCHAR NOT NULL, "
+    "obfuscation VARCHAR NOT NULL, slug VARCHAR NOT NULL, title VARCHAR, description VARCHAR, "
+    "target INTEGER, created DATETIME NOT NULL, updated DATETIME NOT NULL, "
+    "method VARCHAR NOT NULL, beetlmode VARCHAR NOT NULL, PRIMARY KEY (id))",
+    "CREATE INDEX ix_beetl_id ON beetl (id)",
+    "CREATE UNIQUE INDEX ix_beetl_obfuscation_slug ON beetl (obfuscation, slug)",
+    "CREATE TABLE bid (id CHAR(32) NOT NULL, secretkey VARCHAR NOT NULL, name VARCHAR NOT NULL, "
+    "min INTEGER NOT NULL, mid INTEGER, max INTEGER NOT NULL, beetl_obfuscation VARCHAR NOT NULL, "
+    "beetl_slug VARCHAR NOT NULL, created DATETIME NOT NULL, updated DATETIME NOT NULL, PRIMARY KEY (id))",
+    "CREATE INDEX ix_bid_id ON bid (id)",
+    "CREATE INDEX ix_bid_beetl_secretkey ON bid (beetl_obfuscation, beetl_slug, secretkey)",
+    *[
+        f"CREATE INDEX ix_bid_beetl_{sort} ON bid (beetl_obfuscation, beetl_slug, {sort}, id)"
+        for sort in ('created', 'min', 'max', 'name')
+    ],
+    "CREATE TABLE beetlaggregate (beetl_obfuscation VARCHAR NOT NULL, beetl_slug VARCHAR NOT NULL, "
+    "bids_count INTEGER NOT NULL, sum_min INTEGER NOT NULL, sum_mid INTEGER NOT NULL, "
+    "sum_max INTEGER NOT NULL, updated DATETIME NOT NULL, PRIMARY KEY (beetl_obfuscation, beetl_slug))",
+]
+
+
+def _timestamp() -> str:
+    moment = datetime.datetime(2023, 1, 1) + datetime.timedelta(seconds=random.uniform(0, 3e7))
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def build_old(path: str, beetls: int, bids: int):
+
+    connection = sqlite3.connect(path)
+    for statement in old_schema:
+        connection.execute(statement)
+
+    for i in range(beetls):
+        beetl = factory.beetl(slug=f'beetl-{i}')
+        connection.execute(
+            "INSERT INTO beetl VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                uuid.uuid4().hex, 'x' * 43, beetl['obfuscation'], beetl['slug'], beetl['title'],
+                beetl['description'], beetl['target'], _timestamp(), _timestamp(),
+                beetl['method'], beetl['beetlmode'],
+            ),
+        )
+        rows = []
+        for _ in range(bids):
+            bid = factory.bid(beetl['obfuscation'], beetl['slug'])
+            rows.append((
+                uuid.uuid4().hex, 'x' * 43, bid['name'], bid['min'], bid['mid'], bid['max'],
+                beetl['obfuscation'], beetl['slug'], _timestamp(), _timestamp(),
+            ))
+        connection.executemany("INSERT INTO bid VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    connection.execute("INSERT INTO beetlaggregate SELECT beetl_obfuscation, beetl_slug, count(*), "
+                       "sum(min), sum(mid), sum(max), max(updated) FROM bid GROUP BY 1, 2")
+    connection.execute("PRAGMA user_version = 3")
+    connection.commit()
+    connection.close()
+
+
+def sizes(path: str) -> dict:
+
+    connection = sqlite3.connect(path)
+    connection.execute("VACUUM")
+    result = dict(connection.execute(
+        "SELECT name, sum(pgsize - unused) FROM dbstat GROUP BY name"
+    ).fetchall())
+    result['file'] = os.path.getsize(path)
+    connection.close()
+    return result
+
+
+def main(args):
+
+    directory = os.path.dirname(os.environ['BEETL_DATABASE'])
+    before, after = os.path.join(directory, 'before.db'), os.path.join(directory, 'after.db')
+    build_old(before, args.beetls, args.bids)
+    shutil.copy(before, after)
+
+    engine = create_shard_engine(after)
+    migrate(engine)
+    engine.dispose()
+
+    old, new = sizes(before), sizes(after)
+    names = sorted(set(old) | set(new), key=lambda name: (name == 'file', name))
+    print(f"{'':32} {'before':>12} {'after':>12} {'saved':>8}")
+    for name in names:
+        a, b = old.get(name, 0), new.get(name, 0)
+        saved = f"{(a - b) / a:>7.0%}" if a else ''
+        print(f"{name:32} {a:>12,} {b:>12,} {saved:>8}")
+
+    indexes = lambda sizes: sum(size for name, size in sizes.items() if name.startswith(('ix_', 'sqlite_autoindex')))
+    bid_bytes = lambda sizes: sizes.get('bid', 0) / max(args.beetls * args.bids, 1)
+    print(f"\nindexes {indexes(old):,} -> {indexes(new):,} bytes")
+    print(f"bid table per bid {bid_bytes(old):.1f} -> {bid_bytes(new):.1f} bytes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--beetls', type=int, default=200)
+    parser.add_argument('--bids', type=int, default=500, help='bids per beetl')
+    main(parser.parse_args())
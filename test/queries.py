@@ -0,0 +1,32 @@
+from beetlapi.database.main import all_engines
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# the statements every engine ran while the block runs, to pin down how many
+# queries an endpoint needs. transaction control doesn't count, group
+# commit sends some of it through the cursor.
+
+transaction_control = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT')
+
+
+@contextmanager
+def count_queries():
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        if not statement.lstrip().upper().startswith(transaction_control):
+            statements.append(statement)
+
+    engines = all_engines() + all_engines(read_only=True)
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+
+def assert_queries(statements: list, expected: int):
+    assert len(statements) == expected, '\n\n'.join(statements)
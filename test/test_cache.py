@@ -0,0 +1,191 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.cache import LRUCache
+from beetlapi.database import changes
+from beetlapi.database.changes import ChangeFeed, record_changes
+from beetlapi.database.main import BeetlChange, engine, read_engines
+from beetlapi.main import _evict_changes, beetl_cache, bids_cache, change_feeds
+from sqlmodel import Session, func, select
+from test import factory
+import time
+
+testclient = TestClient(app)
+
+
+def test_lru_cache_evicts_least_recently_used():
+
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_lru_cache_expires_after_ttl():
+
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+def test_lru_cache_skips_values_loaded_before_an_invalidation():
+
+    cache = LRUCache(maxsize=2, ttl=60)
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.set('a', 'stale', generation)
+    assert cache.get('a') is None
+
+def test_lru_cache_weighs_values():
+
+    cache = LRUCache(maxsize=10, ttl=60, weigh=len)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    cache.set('a', b'123456')
+    assert cache.size == 10
+
+    cache.set('c', b'12')
+    assert cache.get('b') is None
+    assert cache.size == 8
+    assert cache.evictions == 1
+
+    # bigger than the whole cache
+    cache.set('d', b'x' * 11)
+    assert cache.get('d') is None
+    assert cache.size == 8
+
+def test_beetl_reads_are_cached_and_invalidated_by_writes():
+
+    beetl = factory.beetl(title='initial title')
+    secretkey = testclient.post('/beetl', json=beetl).json()['secretkey']
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    testclient.get('/beetl', params=params)
+    hits = beetl_cache.hits
+    assert testclient.get('/beetl', params=params).json()['title'] == 'initial title'
+    assert beetl_cache.hits == hits + 1
+
+    testclient.patch('/beetl', json={**beetl, 'title': 'new title', 'secretkey': secretkey})
+    assert testclient.get('/beetl', params=params).json()['title'] == 'new title'
+
+    testclient.delete('/beetl', params={**params, 'secretkey': secretkey})
+    assert (beetl['obfuscation'], beetl['slug']) not in beetl_cache._data
+
+def test_bids_are_served_encoded_from_the_cache():
+
+    beetl = factory.beetl(beetlmode='public')
+    secretkey = testclient.post('/beetl', json=beetl).json()['secretkey']
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+
+    first = testclient.get('/bids', params=params)
+    hits = bids_cache.hits
+    second = testclient.get('/bids', params=params)
+    assert bids_cache.hits == hits + 1
+    assert second.content == first.content
+    assert second.headers['etag'] == first.headers['etag']
+    assert testclient.get('/bids', params=params, headers={'If-None-Match': first.headers['etag']}).status_code == 304
+
+    # every kind of write drops the entry
+    writes = [
+        lambda: testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])),
+        lambda: testclient.post('/bids/batch', json=[factory.bid(beetl['obfuscation'], beetl['slug'])]),
+        lambda: testclient.patch('/bid', json={**bid, 'name': 'renamed'}),
+        lambda: testclient.delete('/bid', params={
+            'beetl_obfuscation': bid['beetl_obfuscation'],
+            'beetl_slug': bid['beetl_slug'],
+            'secretkey': bid['secretkey'],
+        }),
+        lambda: testclient.patch('/beetl', json={**beetl, 'beetlmode': 'private', 'secretkey': secretkey}),
+    ]
+    for write in writes:
+        before = testclient.get('/bids', params=params).json()
+        assert write().status_code == 200
+        assert (beetl['obfuscation'], beetl['slug']) not in bids_cache._data
+        assert testclient.get('/bids', params=params).json() != before
+
+    assert testclient.get('/bids', params=params).json()['bids'] == []
+
+def test_paginated_bids_bypass_the_cache():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post('/beetl', json=beetl)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug'], 'limit': 10}
+    testclient.get('/bids', params=params)
+    assert (beetl['obfuscation'], beetl['slug']) not in bids_cache._data
+
+def _written_elsewhere(*keys):
+
+    # what another worker's write leaves behind
+    with Session(engine) as session:
+        record_changes(session, keys)
+        session.commit()
+
+def test_writes_of_other_workers_are_evicted():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post('/beetl', json=beetl)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    key = (beetl['obfuscation'], beetl['slug'])
+
+    _evict_changes()
+    testclient.get('/beetl', params=params)
+    testclient.get('/bids', params=params)
+    _written_elsewhere(key)
+
+    assert key in beetl_cache._data and key in bids_cache._data
+    _evict_changes()
+    assert key not in beetl_cache._data and key not in bids_cache._data
+
+def test_change_feed_reads_only_after_others_committed():
+
+    feed = ChangeFeed(read_engines[0])
+    assert feed.poll() == set()
+    assert feed.poll() == set()
+
+    _written_elsewhere(('a', 'b'), ('c', 'd'))
+    _written_elsewhere(('a', 'b'))
+    assert feed.poll() == {('a', 'b'), ('c', 'd')}
+    assert feed.poll() == set()
+    feed.close()
+
+def test_api_writes_are_recorded():
+
+    feed = ChangeFeed(read_engines[0])
+    feed.poll()
+
+    beetl = factory.beetl()
+    secretkey = testclient.post('/beetl', json=beetl).json()['secretkey']
+    bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+    assert feed.poll() == {(beetl['obfuscation'], beetl['slug'])}
+
+    testclient.delete('/bid', params={
+        'beetl_obfuscation': beetl['obfuscation'],
+        'beetl_slug': beetl['slug'],
+        'secretkey': bid['secretkey'],
+    })
+    testclient.delete('/beetl', params={**beetl, 'secretkey': secretkey})
+    assert feed.poll() == {(beetl['obfuscation'], beetl['slug'])}
+    feed.close()
+
+def test_change_feed_that_missed_pruned_changes_evicts_everything(monkeypatch):
+
+    feed, other = ChangeFeed(read_engines[0]), ChangeFeed(read_engines[0])
+    feed.poll()
+    other.poll()
+    _written_elsewhere(('a', 'b'))
+    assert other.poll() == {('a', 'b')}
+
+    monkeypatch.setattr(changes, 'keep', 0)
+    time.sleep(0.01)
+    other.prune(engine, interval=0)
+    with Session(engine) as session:
+        assert session.exec(select(func.count()).select_from(BeetlChange)).one() == 0
+
+    assert feed.poll() is None
+    feed.close()
+    other.close()
@@ -0,0 +1,56 @@
+from beetlapi.database.main import engine, sqlite_pragmas
+from sqlalchemy import text
+
+
+def test_pragmas_are_applied_on_every_connection():
+
+    for _ in range(2):
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+            # NORMAL
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == sqlite_pragmas['busy_timeout']
+            assert connection.execute(text("PRAGMA cache_size")).scalar() == sqlite_pragmas['cache_size']
+            # MEMORY
+            assert connection.execute(text("PRAGMA temp_store")).scalar() == 2
+        engine.dispose()
+
+def test_aggregates_follow_bid_writes_and_match_rebuild():
+
+    from fastapi.testclient import TestClient
+    from beetlapi import app
+    from beetlapi.database.aggregates import get_aggregate, rebuild_aggregates
+    from sqlmodel import Session
+    from test import factory
+
+    testclient = TestClient(app)
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    obfuscation, slug = beetl['obfuscation'], beetl['slug']
+
+    bids = [
+        testclient.post('/bid', json=factory.bid(obfuscation, slug, min=10, mid=20, max=30)).json(),
+        testclient.post('/bid', json=factory.bid(obfuscation, slug, min=1, mid=2, max=3)).json(),
+    ]
+    no_mid = factory.bid(obfuscation, slug, min=5, max=7)
+    no_mid['mid'] = None
+    bids.append(testclient.post('/bid', json=no_mid).json())
+
+    testclient.patch('/bid', json={**bids[0], 'max': 40})
+    testclient.delete('/bid', params={
+        'beetl_obfuscation': obfuscation,
+        'beetl_slug': slug,
+        'secretkey': bids[1]['secretkey'],
+    })
+
+    def current():
+        with Session(engine) as session:
+            a = get_aggregate(session, obfuscation, slug)
+            return a.bids_count, a.sum_min, a.sum_mid, a.sum_max
+
+    assert current() == (2, 15, 25, 47)
+
+    with engine.begin() as connection:
+        rebuild_aggregates(connection)
+
+    assert current() == (2, 15, 25, 47)
@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.etag import etag_matches
+from test import factory
+
+testclient = TestClient(app)
+
+
+def test_etag_matches():
+
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"x", W/"abc"')
+    assert etag_matches('W/"abc"', '*')
+    assert not etag_matches('W/"abc"', 'W/"abcd"')
+    assert not etag_matches('W/"abc"', None)
+
+def _beetl_with_bid(beetlmode):
+
+    beetl = factory.beetl(beetlmode=beetlmode)
+    beetl['secretkey'] = testclient.post('/beetl', json=beetl).json()['secretkey']
+    bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    return beetl, bid, params
+
+def test_get_beetl_not_modified():
+
+    beetl, bid, params = _beetl_with_bid('public')
+
+    etag = testclient.get('/beetl', params=params).headers['etag']
+    response = testclient.get('/beetl', params=params, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    testclient.patch('/beetl', json={**beetl, 'title': 'changed'})
+    response = testclient.get('/beetl', params=params, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+def test_get_bids_not_modified_until_a_bid_changes():
+
+    for beetlmode in ['public', 'private']:
+        beetl, bid, params = _beetl_with_bid(beetlmode)
+
+        etag = testclient.get('/bids', params=params).headers['etag']
+        response = testclient.get('/bids', params=params, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        testclient.patch('/bid', json={**bid, 'name': 'changed'})
+        response = testclient.get('/bids', params=params, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        etag = response.headers['etag']
+
+        testclient.delete('/bid', params={
+            'beetl_obfuscation': beetl['obfuscation'],
+            'beetl_slug': beetl['slug'],
+            'secretkey': bid['secretkey'],
+        })
+        response = testclient.get('/bids', params=params, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json()['bids_total'] == 0
+
+        etag = response.headers['etag']
+        response = testclient.get('/bids', params=params, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+def test_get_bids_pages_and_orders_have_their_own_etags():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post('/beetl', json=beetl)
+    for bid in factory.create_bids(beetl['obfuscation'], beetl['slug'], amount=3):
+        testclient.post('/bid', json=bid)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug'], 'limit': 1}
+
+    first = testclient.get('/bids', params=params)
+    etag = first.headers['etag']
+    second = {**params, 'cursor': first.json()['next_cursor']}
+    for other in [second, {**params, 'limit': 2}, {**params, 'order': 'desc'}, {**params, 'sort': 'name'}]:
+        assert testclient.get('/bids', params=other, headers={'If-None-Match': etag}).status_code == 200
+
+    assert testclient.get('/bids', params=params, headers={'If-None-Match': etag}).status_code == 304
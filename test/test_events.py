@@ -0,0 +1,88 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.events import Hub
+from beetlapi.main import bid_events, hub
+from test import factory
+import asyncio
+import json
+import threading
+
+testclient = TestClient(app)
+
+
+def test_hub_fans_out_per_key_across_threads():
+
+    async def run():
+        local = Hub(queue_size=8)
+        with local.subscribe('a') as a, local.subscribe('a') as a2, local.subscribe('b') as b:
+            thread = threading.Thread(target=local.publish, args=('a', 'bids_created', {'n': 1}))
+            thread.start()
+            thread.join()
+
+            assert await asyncio.wait_for(a.get(), 1) == ('bids_created', '{"n": 1}')
+            assert await asyncio.wait_for(a2.get(), 1) == ('bids_created', '{"n": 1}')
+            assert b.queue.empty()
+
+        assert local.subscribers() == 0
+
+    asyncio.run(run())
+
+def test_slow_subscriber_gets_a_resync_instead_of_blocking():
+
+    async def run():
+        local = Hub(queue_size=3)
+        with local.subscribe('a') as slow:
+            for n in range(5):
+                local.publish('a', 'bids_created', {'n': n})
+            await asyncio.sleep(0)
+
+            events = [slow.queue.get_nowait() for _ in range(slow.queue.qsize())]
+            assert events[0] == ('resync', '{}')
+            assert events[-1] == ('bids_created', '{"n": 4}')
+            assert slow.resyncs >= 1
+
+    asyncio.run(run())
+
+def _event(chunk):
+
+    lines = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+    return lines['event'], json.loads(lines['data'])
+
+def test_bid_events_stream():
+
+    for beetlmode in ['public', 'private']:
+        beetl = factory.beetl(beetlmode=beetlmode)
+        secretkey = testclient.post('/beetl', json=beetl).json()['secretkey']
+
+        async def run():
+            response = await bid_events(beetl['obfuscation'], beetl['slug'])
+            stream = response.body_iterator
+
+            assert _event(await stream.__anext__()) == ('totals', {'bids_total': 0})
+
+            bid = factory.bid(beetl['obfuscation'], beetl['slug'])
+            await asyncio.to_thread(testclient.post, '/bid', json=bid)
+            type, data = _event(await asyncio.wait_for(stream.__anext__(), 5))
+            assert type == 'bids_created'
+            assert data['bids_total'] == 1
+            if beetlmode == 'public':
+                assert data['bids'][0]['name'] == bid['name']
+                assert 'secretkey' not in data['bids'][0]
+            else:
+                assert 'bids' not in data
+
+            params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug'], 'secretkey': secretkey}
+            await asyncio.to_thread(testclient.delete, '/beetl', params=params)
+            type, data = _event(await asyncio.wait_for(stream.__anext__(), 5))
+            assert type == 'beetl_deleted'
+
+            # the stream ends with the beetl
+            try:
+                await stream.__anext__()
+                assert False
+            except StopAsyncIteration:
+                pass
+
+        asyncio.run(run())
+
+    assert hub.subscribers() == 0
@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.export import export_csv
+from test import factory
+import csv
+import io
+import json
+
+testclient = TestClient(app)
+
+
+def _beetl(beetlmode, amount):
+
+    beetl = factory.beetl(beetlmode=beetlmode)
+    testclient.post('/beetl', json=beetl)
+    for bid in factory.create_bids(beetl['obfuscation'], beetl['slug'], amount=amount):
+        testclient.post('/bid', json=bid)
+    return {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+def test_export_ndjson_matches_bids():
+
+    params = _beetl('public', 7)
+    bids = testclient.get('/bids', params=params).json()['bids']
+
+    response = testclient.get('/bids/export', params=params)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == bids
+
+def test_export_csv_in_batches():
+
+    params = _beetl('public', 7)
+    chunks = list(export_csv(params['obfuscation'], params['slug'], visible=True, batch_size=3))
+    assert len(chunks) == 3
+
+    rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+    assert len(rows) == 7
+
+    response = testclient.get('/bids/export', params={**params, 'format': 'csv'})
+    assert response.text == b''.join(chunks).decode()
+
+def test_export_of_private_beetl_has_no_bids():
+
+    params = _beetl('private', 3)
+
+    response = testclient.get('/bids/export', params=params)
+    assert response.status_code == 200
+    assert response.text == ''
+
+    response = testclient.get('/bids/export', params={**params, 'format': 'csv'})
+    assert response.text.strip() == 'id,name,min,mid,max,beetl_obfuscation,beetl_slug,created,updated'
+
+def test_export_unknown_beetl():
+
+    response = testclient.get('/bids/export', params={'obfuscation': 'x', 'slug': 'y'})
+    assert response.status_code == 404
@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.metrics import Histogram, queries_total, request_seconds, requests_total
+from test import factory
+
+testclient = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+
+    histogram = Histogram('h', 'help', ('route',), buckets=(.1, 1))
+    histogram.observe(.05, '/a')
+    histogram.observe(.5, '/a')
+    histogram.observe(5, '/a')
+
+    lines = histogram.render()
+    assert 'h_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'h_bucket{route="/a",le="1"} 2' in lines
+    assert 'h_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'h_count{route="/a"} 3' in lines
+    assert 'h_sum{route="/a"} 5.55' in lines
+
+def test_requests_and_queries_are_counted_per_route():
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    requests = requests_total.value('/bids', 'GET', '200')
+    observed = request_seconds.count('/bids', 'GET')
+    selects = queries_total.value('SELECT', '/bids')
+
+    assert testclient.get('/bids', params=params).status_code == 200
+
+    assert requests_total.value('/bids', 'GET', '200') == requests + 1
+    assert request_seconds.count('/bids', 'GET') == observed + 1
+    assert queries_total.value('SELECT', '/bids') > selects
+
+def test_unknown_paths_share_one_label():
+
+    unmatched = requests_total.value('unmatched', 'GET', '404')
+    testclient.get('/nothing/here')
+    testclient.get('/nothing/else')
+    assert requests_total.value('unmatched', 'GET', '404') == unmatched + 2
+
+def test_metrics_endpoint():
+
+    testclient.get('/beetl', params={'obfuscation': 'nope', 'slug': 'nope'})
+
+    response = testclient.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'beetl_http_requests_total{route="/beetl",method="GET",status="404"}' in response.text
+    assert '# TYPE beetl_db_query_duration_seconds histogram' in response.text
+    assert 'beetl_db_queries_total{statement="SELECT",route="/beetl"}' in response.text
@@ -0,0 +1,149 @@
+from beetlapi.database.main import Beetl, Bid
+from beetlapi.database.migrations import migrate, migrations, get_version
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+import pytest
+import uuid
+
+
+def _old_database(path):
+
+    # schema as created before there were any migrations
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE beetl (id CHAR(32) PRIMARY KEY, secretkey VARCHAR, "
+            "obfuscation VARCHAR, slug VARCHAR, title VARCHAR, description VARCHAR, "
+            "target INTEGER, created DATETIME, updated DATETIME, method VARCHAR, "
+            "beetlmode VARCHAR)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE bid (id CHAR(32) PRIMARY KEY, secretkey VARCHAR, "
+            "name VARCHAR, min INTEGER, mid INTEGER, max INTEGER, "
+            "beetl_obfuscation VARCHAR, beetl_slug VARCHAR, "
+            "created DATETIME, updated DATETIME)"
+        ))
+        for id in [uuid.uuid4().hex, uuid.uuid4().hex]:
+            connection.execute(text(
+                "INSERT INTO beetl (id, secretkey, obfuscation, slug, created, updated, method, beetlmode) "
+                "VALUES (:id, 'key', 'obf', 'slug', :at, :at, 'stepwise', 'public')"
+            ), {'id': id, 'at': '2023-01-01 00:00:00.000000'})
+        for slug, min in [('slug', 1), ('slug', 2), ('gone', 3)]:
+            connection.execute(text(
+                "INSERT INTO bid (id, secretkey, name, min, max, beetl_obfuscation, beetl_slug, created, updated) "
+                "VALUES (:id, 'key', 'joe', :min, 10, 'obf', :slug, :at, :at)"
+            ), {'id': uuid.uuid4().hex, 'slug': slug, 'min': min, 'at': '2023-01-01 00:00:00.123456'})
+    return engine
+
+def test_migrate_adds_lookup_indexes(tmp_path):
+
+    engine = _old_database(tmp_path / 'old.db')
+    migrate(engine)
+
+    indexes = inspect(engine).get_indexes('beetl')
+    assert {'name': 'ix_beetl_obfuscation_slug', 'column_names': ['obfuscation', 'slug'], 'unique': 1} in indexes
+    assert 'ix_bid_beetl_secretkey' in [i['name'] for i in inspect(engine).get_indexes('bid')]
+
+    with engine.connect() as connection:
+        assert get_version(connection) == len(migrations)
+        assert connection.execute(text("SELECT count(*) FROM beetl")).scalar() == 1
+        assert connection.execute(text(
+            "SELECT bids_count, sum_min, sum_mid, sum_max FROM beetlaggregate"
+        )).all() == [(2, 3, 3, 20)]
+
+def test_migrate_logs_the_duplicate_beetls_it_drops(tmp_path, caplog):
+
+    # _old_database has two beetls obf/slug
+    engine = _old_database(tmp_path / 'old.db')
+    with engine.connect() as connection:
+        ids = connection.execute(text("SELECT id FROM beetl ORDER BY rowid")).scalars().all()
+
+    with caplog.at_level('WARNING', logger='beetlapi.database.migrations'):
+        migrate(engine)
+
+    assert "dropping 1 duplicate beetls" in caplog.text
+    assert ids[1] in caplog.text
+    with Session(engine) as session:
+        assert [beetl.id.hex for beetl in session.exec(select(Beetl)).all()] == [ids[0]]
+
+def test_migrate_twice_is_noop(tmp_path):
+
+    engine = _old_database(tmp_path / 'old.db')
+    migrate(engine)
+    migrate(engine)
+
+    with engine.connect() as connection:
+        assert get_version(connection) == len(migrations)
+
+def test_migrate_compacts_ids_timestamps_and_beetl_references(tmp_path):
+
+    engine = _old_database(tmp_path / 'old.db')
+    with engine.connect() as connection:
+        ids = connection.execute(text("SELECT id FROM bid WHERE beetl_slug = 'slug'")).scalars().all()
+    migrate(engine)
+
+    with engine.connect() as connection:
+        assert 'beetl_obfuscation' not in [c['name'] for c in inspect(engine).get_columns('bid')]
+        assert connection.execute(text(
+            "SELECT DISTINCT typeof(id), length(id), typeof(created), typeof(beetl_key) FROM bid"
+        )).all() == [('blob', 16, 'integer', 'integer')]
+
+    # the bid without a beetl is left behind
+    with Session(engine) as session:
+        bids = session.exec(select(Bid).order_by(Bid.min)).all()
+        beetl = session.exec(select(Beetl).where(Beetl.key == bids[0].beetl_key)).one()
+    assert sorted(bid.id.hex for bid in bids) == sorted(ids)
+    assert bids[0].created == datetime(2023, 1, 1, 0, 0, 0, 123456)
+    assert (beetl.obfuscation, beetl.slug) == ('obf', 'slug')
+
+def test_migrate_stops_reusing_beetl_keys(tmp_path):
+
+    # compacted before beetl keys were AUTOINCREMENT
+    engine = _old_database(tmp_path / 'old.db')
+    migrate(engine)
+    with engine.begin() as connection:
+        sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'beetl'")).scalar()
+        assert 'AUTOINCREMENT' in sql
+        connection.execute(text("ALTER TABLE beetl RENAME TO old_beetl"))
+        connection.execute(text(sql.replace(' AUTOINCREMENT', '')))
+        connection.execute(text("INSERT INTO beetl SELECT * FROM old_beetl"))
+        connection.execute(text("DROP TABLE old_beetl"))
+        connection.execute(text("PRAGMA user_version = 4"))
+
+    migrate(engine)
+    with Session(engine) as session:
+        beetl = session.exec(select(Beetl)).one()
+        key = beetl.key
+        session.delete(beetl)
+        session.commit()
+
+        session.add(Beetl(obfuscation='obf', slug='new', method='stepwise', beetlmode='public'))
+        session.commit()
+        assert session.exec(select(Beetl.key)).one() > key
+
+def test_migrate_that_fails_partway_changes_nothing(tmp_path):
+
+    # the copy of _compact_storage fails on the last bid, after the tables
+    # were renamed already
+    engine = _old_database(tmp_path / 'old.db')
+    with engine.begin() as connection:
+        for migration in migrations[:3]:
+            migration(connection)
+        connection.execute(text("PRAGMA user_version = 3"))
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO bid (id, secretkey, name, min, max, beetl_obfuscation, beetl_slug, created, updated) "
+            "VALUES ('not a uuid', 'key', 'joe', 1, 10, 'obf', 'slug', :at, :at)"
+        ), {'at': '2023-01-01 00:00:00'})
+        tables = connection.execute(text("SELECT name, sql FROM sqlite_master ORDER BY name")).all()
+        bids = connection.execute(text("SELECT * FROM bid ORDER BY id")).all()
+
+    with pytest.raises(OperationalError):
+        migrate(engine)
+
+    with engine.connect() as connection:
+        assert get_version(connection) == 3
+        assert connection.execute(text("SELECT name, sql FROM sqlite_master ORDER BY name")).all() == tables
+        assert connection.execute(text("SELECT * FROM bid ORDER BY id")).all() == bids
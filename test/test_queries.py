@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.main import beetl_cache, bids_cache
+from test import factory
+from test.queries import assert_queries, count_queries
+
+testclient = TestClient(app)
+
+# how many statements each endpoint needs with cold caches. when one of
+# these goes up, something started querying more than it has to.
+
+
+def _cold(method: str, url: str, expected: int, **kwargs):
+
+    beetl_cache.clear()
+    bids_cache.clear()
+    with count_queries() as statements:
+        response = testclient.request(method, url, **kwargs)
+    assert response.status_code == 200, response.text
+    assert_queries(statements, expected)
+    return response.json()
+
+def _queries(beetlmode: str):
+
+    beetl = factory.beetl(beetlmode=beetlmode)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    beetl['secretkey'] = _cold('POST', '/beetl', 1, json=beetl)['secretkey']
+
+    bid = factory.bid(beetl['obfuscation'], beetl['slug'])
+    bid['secretkey'] = _cold('POST', '/bid', 4, json=bid)['secretkey']
+    batch = [factory.bid(beetl['obfuscation'], beetl['slug']) for _ in range(3)]
+    created = _cold('POST', '/bids/batch', 4, json=batch)['results'][0]
+
+    _cold('GET', '/beetl', 1, params=params)
+    _cold('GET', '/beetl/settlement', 2, params=params)
+    _cold('GET', '/bids', 3 if beetlmode == 'public' else 2, params=params)
+    _cold('GET', '/beetl/full', 1, params=params)
+
+    _cold('PATCH', '/beetl', 3, json={**beetl, 'title': 'counted'})
+    _cold('PATCH', '/bid', 4, json={**bid, 'name': 'counted'})
+    _cold('POST', '/checksecretkey', 1, json={'id': created['id'], 'secretkey': created['secretkey']})
+
+    bid_params = {'beetl_obfuscation': beetl['obfuscation'], 'beetl_slug': beetl['slug'], 'secretkey': bid['secretkey']}
+    _cold('DELETE', '/bid', 4, params=bid_params)
+    _cold('DELETE', '/beetl', 5, params={**params, 'secretkey': beetl['secretkey']})
+
+def test_queries_per_endpoint_public():
+    _queries('public')
+
+def test_queries_per_endpoint_private():
+    _queries('private')
+
+def test_cached_reads_need_no_queries():
+
+    beetl = factory.beetl(beetlmode='public')
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+    testclient.post('/beetl', json=beetl)
+    testclient.get('/beetl', params=params)
+    testclient.get('/bids', params=params)
+
+    with count_queries() as statements:
+        assert testclient.get('/beetl', params=params).status_code == 200
+        assert testclient.get('/bids', params=params).status_code == 200
+    assert_queries(statements, 0)
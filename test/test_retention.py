@@ -0,0 +1,106 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.database.main import Beetl, BeetlAggregate, Bid, engine
+from beetlapi.database import retention
+from beetlapi.database.retention import purge_expired, stats
+from datetime import datetime, timedelta
+from sqlalchemy import text, update
+from sqlmodel import Session, select
+from test import factory
+
+testclient = TestClient(app)
+
+
+def _beetl(amount: int, age: timedelta, bid_age: timedelta = None):
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    for bid in factory.create_bids(beetl['obfuscation'], beetl['slug'], amount=amount):
+        testclient.post('/bid', json=bid)
+
+    obfuscation, slug = beetl['obfuscation'], beetl['slug']
+    then = datetime.utcnow() - age
+    bid_then = datetime.utcnow() - (bid_age or age)
+    with Session(engine) as session:
+        beetl_key = session.exec(select(Beetl.key).where(Beetl.obfuscation == obfuscation)).one()
+        session.exec(update(Beetl).where(Beetl.obfuscation == obfuscation).values(updated=then))
+        session.exec(update(Bid).where(Bid.beetl_key == beetl_key).values(updated=bid_then))
+        session.exec(update(BeetlAggregate).where(BeetlAggregate.beetl_obfuscation == obfuscation).values(updated=bid_then))
+        session.commit()
+    return obfuscation, slug, beetl_key
+
+def _exists(key):
+
+    with Session(engine) as session:
+        beetl = session.exec(select(Beetl).where(Beetl.obfuscation == key[0])).first()
+        bids = session.exec(select(Bid).where(Bid.beetl_key == key[2])).all()
+    return bool(beetl), len(bids)
+
+def test_purge_expired_beetls_with_their_bids_in_chunks():
+
+    expired = [_beetl(5, timedelta(days=400)) for _ in range(3)]
+    fresh = _beetl(2, timedelta(days=1))
+    # the beetl itself is old, but people still bid
+    busy = _beetl(2, timedelta(days=400), bid_age=timedelta(days=1))
+
+    purged = []
+    passes = stats['passes']
+    result = purge_expired(engine, timedelta(days=365), chunk_size=2, on_purge=purged.extend)
+
+    assert result['beetls'] >= 3
+    assert result['bids'] >= 15
+    assert {key[:2] for key in expired} <= set(purged)
+    assert stats['passes'] == passes + 1
+    assert stats['last_pass'] is result
+
+    for key in expired:
+        assert _exists(key) == (False, 0)
+    assert _exists(fresh) == (True, 2)
+    assert _exists(busy) == (True, 2)
+
+def test_a_write_during_the_pass_keeps_the_beetl(monkeypatch):
+
+    key = _beetl(2, timedelta(days=400))
+    purge = retention._purge
+
+    def bid_first(engine, expired, cutoff):
+        # a bid arrives after the pass picked the beetl
+        if key[2] in [beetl.key for beetl in expired]:
+            assert testclient.post('/bid', json=factory.bid(*key[:2])).status_code == 200
+        return purge(engine, expired, cutoff)
+
+    monkeypatch.setattr(retention, '_purge', bid_first)
+    purged = []
+    purge_expired(engine, timedelta(days=365), on_purge=purged.extend)
+
+    assert key[:2] not in purged
+    assert _exists(key) == (True, 3)
+
+def _pages() -> tuple:
+    with engine.connect() as connection:
+        return tuple(connection.exec_driver_sql(f"PRAGMA {pragma}").scalar() for pragma in ('page_count', 'freelist_count'))
+
+def test_purge_hands_back_the_freed_pages():
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    for _ in range(3):
+        testclient.post('/bids/batch', json=[factory.bid(beetl['obfuscation'], beetl['slug']) for _ in range(1000)])
+    with Session(engine) as session:
+        session.exec(update(Beetl).where(Beetl.obfuscation == beetl['obfuscation']).values(updated=datetime(2000, 1, 1)))
+        session.exec(update(BeetlAggregate).where(BeetlAggregate.beetl_obfuscation == beetl['obfuscation']).values(updated=datetime(2000, 1, 1)))
+        session.commit()
+
+    pages, _ = _pages()
+    purge_expired(engine, timedelta(days=365))
+    after, free = _pages()
+    assert free == 0
+    assert after < pages - 50
+
+def test_retention_is_in_the_metrics():
+
+    purge_expired(engine, timedelta(days=365))
+    body = testclient.get('/metrics').text
+    assert f"beetl_retention_passes_total {stats['passes']}" in body
+    assert f'beetl_retention_purged_total{{table="bid"}} {stats["bids"]}' in body
+    assert 'beetl_retention_last_pass_seconds ' in body
@@ -0,0 +1,87 @@
+from fastapi.testclient import TestClient
+from fastapi.encoders import jsonable_encoder
+from beetlapi import app
+from beetlapi.database.main import Beetl, Bid, engine
+from beetlapi.database.models import BeetlRead, BidRead, BidsRead, SettlementRead
+from beetlapi.serialization import bid_dict, select_bids
+from beetlapi.settlement import settle
+from sqlmodel import Session, select
+from test import factory
+import json
+
+testclient = TestClient(app)
+
+
+def _as_response_model(model, content) -> str:
+    # what fastapi sent before: validated through response_model, json module
+    return json.dumps(jsonable_encoder(model.validate(content)))
+
+def test_bids_match_the_response_model():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post('/beetl', json=beetl)
+    for _ in range(3):
+        testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug']))
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    with Session(engine) as session:
+        bids = session.exec(
+            select_bids(Bid).where(Beetl.obfuscation == beetl['obfuscation']).order_by(Bid.created, Bid.id)
+        ).all()
+        bids = [BidRead(**bid_dict(bid, beetl['obfuscation'], beetl['slug'])) for bid in bids]
+        expected = {'bids_total': 3, 'bids': bids}
+        expected = _as_response_model(BidsRead, expected)
+
+    response = testclient.get('/bids', params=params)
+    assert response.headers['content-type'] == 'application/json'
+    assert 'etag' in response.headers
+    assert json.loads(response.content) == json.loads(expected)
+    # same key order too
+    assert list(response.json()['bids'][0]) == list(json.loads(expected)['bids'][0])
+
+def test_beetl_matches_the_response_model():
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    with Session(engine) as session:
+        stored = session.exec(select(Beetl).where(Beetl.obfuscation == beetl['obfuscation'])).one()
+        expected = _as_response_model(BeetlRead, BeetlRead.from_orm(stored))
+
+    response = testclient.get('/beetl', params=params)
+    compact = json.dumps(json.loads(expected), separators=(',', ':'), ensure_ascii=False)
+    assert response.content.decode() == compact
+
+def test_settlement_matches_the_response_model():
+
+    # no target: everyone pays their min, ints where the model has floats
+    for target, beetlmode in [(None, 'public'), (15, 'public'), (15, 'private')]:
+        beetl = factory.beetl(beetlmode=beetlmode, method='stepwise', target=target)
+        testclient.post('/beetl', json=beetl)
+        for min, mid in [(1, None), (2, 5)]:
+            bid = {**factory.bid(beetl['obfuscation'], beetl['slug']), 'min': min, 'mid': mid, 'max': 20}
+            testclient.post('/bid', json=bid)
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+        with Session(engine) as session:
+            bids = session.exec(
+                select_bids(Bid).where(Beetl.obfuscation == beetl['obfuscation'])
+            ).all()
+        expected = settle('stepwise', target, *zip(*[(bid.min, bid.mid, bid.max) for bid in bids]))
+        contributions = zip(bids, expected.pop('amounts'))
+        expected['bids_total'] = 2
+        expected['contributions'] = [] if beetlmode == 'private' else [
+            {'id': bid.id, 'name': bid.name, 'amount': amount} for bid, amount in contributions
+        ]
+        expected = json.loads(_as_response_model(SettlementRead, expected))
+
+        response = testclient.get('/beetl/settlement', params=params)
+        content = response.json()
+        content['contributions'].sort(key=lambda contribution: contribution['id'])
+        expected['contributions'].sort(key=lambda contribution: contribution['id'])
+        assert content == expected
+        assert list(content) == list(expected)
+        # 1.0 and 1 are equal to python, not in json
+        assert {key: type(value) for key, value in content.items()} == {key: type(value) for key, value in expected.items()}
+        assert [type(c['amount']) for c in content['contributions']] == [float] * len(expected['contributions'])
@@ -0,0 +1,113 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.database.main import Beetl, engine, read_engines
+from beetlapi.sessions import Sessions
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+from test import factory
+import anyio
+import asyncio
+import httpx
+import pytest
+
+testclient = TestClient(app)
+
+
+@contextmanager
+def _statements():
+
+    # statements per engine while the block runs
+    counts = {'read': 0, 'write': 0}
+    listeners = {
+        'read': lambda *args: counts.__setitem__('read', counts['read'] + 1),
+        'write': lambda *args: counts.__setitem__('write', counts['write'] + 1),
+    }
+    event.listen(read_engines[0], 'before_cursor_execute', listeners['read'])
+    event.listen(engine, 'before_cursor_execute', listeners['write'])
+    try:
+        yield counts
+    finally:
+        event.remove(read_engines[0], 'before_cursor_execute', listeners['read'])
+        event.remove(engine, 'before_cursor_execute', listeners['write'])
+
+def test_reads_go_to_the_read_only_engine_and_writes_to_the_writer():
+
+    beetl = factory.beetl(beetlmode='public')
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+
+    with _statements() as counts:
+        testclient.post('/beetl', json=beetl)
+        bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+    assert counts['write'] > 0
+    # the beetl of the bid is looked up outside of the write
+    assert counts['read'] == 1
+
+    with _statements() as counts:
+        assert testclient.get('/beetl', params=params).status_code == 200
+        assert testclient.get('/bids', params=params).json()['bids_total'] == 1
+        check = {'id': bid['id'], 'secretkey': bid['secretkey']}
+        assert testclient.post('/checksecretkey', json=check).json()['status'] == 'success'
+    assert counts['read'] > 0
+    assert counts['write'] == 0
+
+def test_read_only_connections_cannot_write():
+
+    with read_engines[0].connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("DELETE FROM beetl"))
+
+def test_the_writer_is_a_single_connection():
+    assert engine.pool.size() == 1
+    assert engine.pool._max_overflow == 0
+
+def test_nothing_commits_when_the_request_fails():
+
+    beetl = factory.beetl()
+    committed = []
+
+    sessions = Sessions(read_only=False)
+    session = sessions(beetl['obfuscation'])
+    session.add(Beetl(**beetl))
+    session.flush()
+    sessions.on_commit(lambda: committed.append(True))
+    sessions.close()
+
+    with Session(engine) as session:
+        assert not session.exec(select(Beetl).where(Beetl.obfuscation == beetl['obfuscation'])).first()
+    assert not committed
+
+def test_commit_runs_the_callbacks_afterwards():
+
+    beetl = factory.beetl()
+    found = []
+
+    def committed():
+        with Session(engine) as session:
+            found.append(session.exec(select(Beetl).where(Beetl.obfuscation == beetl['obfuscation'])).first())
+
+    sessions = Sessions(read_only=False)
+    sessions(beetl['obfuscation']).add(Beetl(**beetl))
+    sessions.on_commit(committed)
+    sessions.commit()
+    assert found[0] is not None
+
+def test_more_concurrent_writes_than_threads():
+
+    # every thread may be waiting for the writer, the one holding it has
+    # to commit and let go of it without needing another thread
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+
+    async def post_bids():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+            with anyio.fail_after(10):
+                return await asyncio.gather(*[
+                    client.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug']))
+                    for _ in range(10)
+                ])
+
+    responses = asyncio.run(post_bids())
+    assert [response.status_code for response in responses] == [200] * 10
@@ -0,0 +1,84 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.settlement import settle
+from test import factory
+import pytest
+
+testclient = TestClient(app)
+
+mins = [10, 20, 30]
+mids = [20, None, 40]
+maxs = [30, 40, 50]
+
+
+def test_percentage_shares_the_range_evenly():
+
+    s = settle('percentage', 90, mins, mids, maxs)
+    assert s['status'] == 'covered'
+    assert s['factor'] == 0.5
+    assert s['amounts'] == [20, 30, 40]
+    assert s['total'] == 90
+    assert s['shortfall'] == 0
+
+def test_stepwise_fills_up_to_mid_first():
+
+    # effective mids are 20, 20, 40
+    s = settle('stepwise', 70, mins, mids, maxs)
+    assert s['step'] == 1
+    assert s['amounts'] == [15, 20, 35]
+
+    s = settle('stepwise', 100, mins, mids, maxs)
+    assert s['step'] == 2
+    assert s['total'] == 100
+    assert s['amounts'] == [25, 30, 45]
+
+def test_everyone_pays_min_when_target_is_reached_by_mins():
+
+    s = settle('stepwise', 50, mins, mids, maxs)
+    assert s['status'] == 'covered'
+    assert s['amounts'] == mins
+
+def test_not_covered_when_maxs_are_not_enough():
+
+    s = settle('percentage', 200, mins, mids, maxs)
+    assert s['status'] == 'not_covered'
+    assert s['amounts'] == maxs
+    assert s['shortfall'] == 80
+
+def test_no_bids_and_no_target():
+
+    assert settle('percentage', None, [], [], [])['status'] == 'no_target'
+    assert settle('stepwise', 100, [], [], [])['shortfall'] == 100
+
+def test_unknown_method():
+
+    with pytest.raises(ValueError):
+        settle('lottery', 10, mins, mids, maxs)
+
+def test_settlement_endpoint():
+
+    for beetlmode in ['public', 'private']:
+        beetl = factory.beetl(beetlmode=beetlmode, method='percentage', target=90)
+        testclient.post('/beetl', json=beetl)
+        for min, mid, max in zip(mins, mids, maxs):
+            bid = factory.bid(beetl['obfuscation'], beetl['slug'], min=min, max=max)
+            testclient.post('/bid', json=bid)
+
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+        response = testclient.get('/beetl/settlement', params=params)
+        assert response.status_code == 200
+
+        r = response.json()
+        assert r['status'] == 'covered'
+        assert r['total'] == 90
+        assert r['bids_total'] == 3
+        if beetlmode == 'public':
+            assert sorted(c['amount'] for c in r['contributions']) == [20, 30, 40]
+        else:
+            assert r['contributions'] == []
+
+def test_settlement_endpoint_unknown_beetl():
+
+    params = {'obfuscation': 'nope', 'slug': 'nope'}
+    response = testclient.get('/beetl/settlement', params=params)
+    assert response.status_code == 404
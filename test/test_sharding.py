@@ -0,0 +1,126 @@
+from fastapi.testclient import TestClient
+from beetlapi import app, main
+from beetlapi.database import main as database
+from beetlapi.database.main import Beetl, Bid, create_shard_engine, shard_file_name, shard_of
+from beetlapi.database.migrations import migrate
+from beetlapi.database.rebalance import rebalance
+from sqlmodel import Session, SQLModel, func, select
+from test import factory
+import pytest
+
+
+def _count(shard_engine, model, obfuscation=None) -> int:
+    with Session(shard_engine) as session:
+        statement = select(func.count()).select_from(model)
+        if model is Bid:
+            statement = statement.join(Beetl, Beetl.key == Bid.beetl_key)
+        if obfuscation:
+            statement = statement.where(Beetl.obfuscation == obfuscation)
+        return session.exec(statement).one()
+
+def _beetls_on_every_shard(count: int) -> list:
+
+    # a beetl for each shard, for some shards more than one
+    beetls = []
+    while len({shard_of(beetl['obfuscation'], count) for beetl in beetls}) < count:
+        beetls.append(factory.beetl(beetlmode='public'))
+    return beetls
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(database, 'sqlite_file_name', str(tmp_path / 'beetl.db'))
+    engines = [create_shard_engine(shard_file_name(shard)) for shard in range(3)]
+    for shard_engine in engines:
+        SQLModel.metadata.create_all(shard_engine)
+        migrate(shard_engine)
+    read_engines = [create_shard_engine(shard_file_name(shard), read_only=True) for shard in range(3)]
+
+    monkeypatch.setattr(database, 'engines', engines)
+    monkeypatch.setattr(database, 'read_engines', read_engines)
+    yield engines
+    for shard_engine in engines + read_engines:
+        shard_engine.dispose()
+
+def test_shards_are_stable_and_named_after_the_database(monkeypatch):
+
+    # crc32, the same in every process
+    assert shard_of('abcdef', 4) == 3
+
+    monkeypatch.setattr(database, 'sqlite_file_name', '/data/beetl.db')
+    assert shard_file_name(0) == '/data/beetl.db'
+    assert shard_file_name(2) == '/data/beetl.2.db'
+
+def test_endpoints_use_the_shard_of_the_obfuscation(shards):
+
+    testclient = TestClient(app)
+    beetls = _beetls_on_every_shard(3)
+    for beetl in beetls:
+        beetl['secretkey'] = testclient.post('/beetl', json=beetl).json()['secretkey']
+
+    bids = [factory.bid(beetl['obfuscation'], beetl['slug']) for beetl in beetls for _ in range(2)]
+    assert testclient.post('/bids/batch', json=bids).json()['created'] == len(bids)
+    bid = testclient.post('/bid', json=factory.bid(beetls[0]['obfuscation'], beetls[0]['slug'])).json()
+
+    for beetl in beetls:
+        shard = shard_of(beetl['obfuscation'], 3)
+        for index, shard_engine in enumerate(shards):
+            expected = index == shard
+            assert _count(shard_engine, Beetl, beetl['obfuscation']) == expected
+            assert _count(shard_engine, Bid, beetl['obfuscation']) == (expected and (2 + (beetl is beetls[0])))
+
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+        assert testclient.get('/bids', params=params).json()['bids_total'] == 2 + (beetl is beetls[0])
+        assert testclient.get('/beetl/settlement', params=params).status_code == 200
+
+    check = {'id': bid['id'], 'secretkey': bid['secretkey']}
+    assert testclient.post('/checksecretkey', json=check).json()['status'] == 'success'
+
+    beetl = beetls[-1]
+    params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug'], 'secretkey': beetl['secretkey']}
+    assert testclient.delete('/beetl', params=params).json()['bids_deleted'] == 2
+
+def test_rebalance_moves_everything_to_its_shard_and_back(shards):
+
+    for shard_engine in shards:
+        shard_engine.dispose()
+
+    # everything starts out in the single file
+    beetls = _beetls_on_every_shard(3)
+    bids = 100
+    with Session(shards[0]) as session:
+        for beetl in beetls:
+            stored = Beetl(**beetl)
+            session.add(stored)
+            session.flush()
+            for _ in range(bids):
+                session.add(Bid(**factory.bid(beetl['obfuscation'], beetl['slug']), beetl_key=stored.key))
+        session.commit()
+
+    moved = rebalance(count=3, chunk_size=2)
+    misplaced = [beetl for beetl in beetls if shard_of(beetl['obfuscation'], 3) != 0]
+    assert moved['beetls'] == len(misplaced)
+    assert moved['bids'] == bids * len(misplaced)
+    assert moved['empty'] == []
+
+    # beetls get new keys in their new shard, their bids follow
+    for beetl in beetls:
+        shard = shard_of(beetl['obfuscation'], 3)
+        assert _count(shards[shard], Beetl, beetl['obfuscation']) == 1
+        assert _count(shards[shard], Bid, beetl['obfuscation']) == bids
+
+    # running it again changes nothing
+    assert rebalance(count=3)['beetls'] == 0
+
+    moved = rebalance(count=1)
+    assert moved['empty'] == [shard_file_name(1), shard_file_name(2)]
+    assert _count(shards[0], Beetl) == len(beetls)
+    assert _count(shards[0], Bid) == bids * len(beetls)
+    for beetl in beetls:
+        assert _count(shards[0], Bid, beetl['obfuscation']) == bids
+    assert _count(shards[1], Bid) == _count(shards[2], Bid) == 0
+
+    # the emptied files are handed back their space
+    for shard_engine in shards[1:]:
+        with shard_engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+from beetlapi import app
+from beetlapi.database.main import read_engines
+from beetlapi import slowlog
+from test import factory
+import json
+
+testclient = TestClient(app)
+
+
+def test_slow_statements_are_logged_with_plan_and_without_secrets(tmp_path):
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+
+    path = tmp_path / 'slow.log'
+    log = slowlog.enable(read_engines[0], threshold=0, path=str(path))
+    try:
+        response = testclient.post('/checksecretkey', json={'id': bid['id'], 'secretkey': bid['secretkey']})
+        assert response.json()['status'] == 'success'
+    finally:
+        slowlog.disable(read_engines[0], log)
+        for handler in slowlog.logger.handlers:
+            handler.close()
+            slowlog.logger.removeHandler(handler)
+
+    text = path.read_text()
+    assert bid['secretkey'] not in text
+
+    entries = [json.loads(line) for line in text.splitlines()]
+    select = next(entry for entry in entries if entry['statement'].startswith('SELECT'))
+    assert select['route'] == '/checksecretkey'
+    assert select['duration_ms'] >= 0
+    assert slowlog.redacted in select['parameters']
+    assert select['plan'] and all(isinstance(step, str) for step in select['plan'])
+
+def test_unnamed_parameters_are_redacted():
+    assert slowlog.redact(None, ('secret', 1)) == [slowlog.redacted, slowlog.redacted]
@@ -3,6 +3,9 @@ from beetlapi import app
 from test import factory
 import unittest
 import random
+import base64
+import json
+import uuid
 from beetlapi.database.main import engine, Bid, Beetl
 from sqlmodel import Session, select
 
@@ -58,6 +61,15 @@ def test_post_throws_back_secret_key_to_edit_beetl():
     beetl = response.json()
     assert beetl.get('secretkey')
 
+def test_post_beetl_twice_conflicts():
+
+    post_beetl = factory.beetl()
+    response = testclient.post(url='/beetl', json=post_beetl)
+    assert response.status_code == 200
+
+    response = testclient.post(url='/beetl', json=post_beetl)
+    assert response.status_code == 409
+
 def test_can_not_edit_beetl_without_key():
 
     slug = 'our-little-beetl'
@@ -371,10 +383,7 @@ def test_delete_bid():
 
     with Session(engine) as session:
         db_bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == bid.get('beetl_obfuscation'))
-            .where(Bid.beetl_slug ==        bid.get('beetl_slug'))
-            .where(Bid.secretkey ==         bid.get('secretkey'))
+            select(Bid).where(Bid.secretkey == bid.get('secretkey'))
         ).first()
 
     assert db_bid
@@ -392,10 +401,7 @@ def test_delete_bid():
 
     with Session(engine) as session:
         db_bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == bid.get('beetl_obfuscation'))
-            .where(Bid.beetl_slug ==        bid.get('beetl_slug'))
-            .where(Bid.secretkey ==         bid.get('secretkey'))
+            select(Bid).where(Bid.secretkey == bid.get('secretkey'))
         ).first()
 
     assert not db_bid
@@ -455,11 +461,7 @@ def test_delete_beetl_deletes_all_its_bids_aswell():
     bid = testdata.get('closed_bids')[1]
 
     with Session(engine) as session:
-        db_bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == bid.get('beetl_obfuscation'))
-            .where(Bid.beetl_slug ==        bid.get('beetl_slug'))
-        ).first()
+        db_bid = session.exec(select(Bid).where(Bid.secretkey == bid.get('secretkey'))).first()
 
     assert db_bid
 
@@ -472,13 +474,172 @@ def test_delete_beetl_deletes_all_its_bids_aswell():
               }
     response = testclient.delete('/beetl', params=params)
     assert response.status_code == 200
+    assert response.json().get('bids_deleted') == 5
 
     with Session(engine) as session:
-        db_bid = session.exec(
-            select(Bid)
-            .where(Bid.beetl_obfuscation == bid.get('beetl_obfuscation'))
-            .where(Bid.beetl_slug ==        bid.get('beetl_slug'))
-        ).all()
+        db_bid = session.exec(select(Bid).where(Bid.beetl_key == db_bid.beetl_key)).all()
 
     assert not db_bid
 
+
+def test_get_bids_paginated():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post(url='/beetl', json=beetl)
+    for i, name in enumerate(factory.names):
+        bid = factory.bid(beetl['obfuscation'], beetl['slug'], name=name, min=1 + i % 3)
+        testclient.post('/bid', json=bid)
+
+    for sort in ['created', 'min', 'max', 'name']:
+        for order in ['asc', 'desc']:
+            params = {
+                'obfuscation': beetl['obfuscation'],
+                'slug': beetl['slug'],
+                'sort': sort,
+                'order': order,
+            }
+            everything = testclient.get('/bids', params=params).json()['bids']
+
+            pages = []
+            params['limit'] = 5
+            while True:
+                r = testclient.get('/bids', params=params).json()
+                assert r['bids_total'] == len(factory.names)
+                pages += r['bids']
+                if not r['next_cursor']:
+                    break
+                params['cursor'] = r['next_cursor']
+
+            assert pages == everything
+            values = [bid[sort] for bid in pages]
+            assert values == sorted(values, reverse=order == 'desc')
+
+def test_get_bids_rejects_foreign_cursor():
+
+    open_beetl = factory.beetl(beetlmode='public')
+    testclient.post(url='/beetl', json=open_beetl)
+    for bid in factory.create_bids(open_beetl['obfuscation'], open_beetl['slug'], amount=2):
+        testclient.post('/bid', json=bid)
+    params = {'obfuscation': open_beetl['obfuscation'], 'slug': open_beetl['slug'], 'limit': 1}
+
+    cursor = testclient.get('/bids', params=params).json()['next_cursor']
+    response = testclient.get('/bids', params={**params, 'cursor': cursor, 'sort': 'name'})
+    assert response.status_code == 422
+    response = testclient.get('/bids', params={**params, 'cursor': 'garbage'})
+    assert response.status_code == 422
+
+    # well-formed json, but not what encode_cursor makes
+    id = uuid.uuid4().hex
+    crafted = [
+        (['created', 'asc', '2020-01-01', 5], 'created'),
+        (['name', 'asc', [1], id], 'name'),
+        (['min', 'asc', {'x': 1}, id], 'min'),
+        (['max', 'asc', True, id], 'max'),
+        (['created', 'asc', 5, id], 'created'),
+        (['created', 'asc', '2020-01-01'], 'created'),
+        ({'sort': 'created'}, 'created'),
+    ]
+    for payload, sort in crafted:
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        response = testclient.get('/bids', params={**params, 'cursor': cursor, 'sort': sort})
+        assert response.status_code == 422, payload
+
+def test_post_bids_batch():
+
+    beetl = factory.beetl(beetlmode='public')
+    testclient.post(url='/beetl', json=beetl)
+    bids = factory.create_bids(beetl['obfuscation'], beetl['slug'], amount=4)
+    del bids[1]['max']
+    bids.insert(2, 'not a bid')
+
+    response = testclient.post('/bids/batch', json=bids)
+    assert response.status_code == 200
+    r = response.json()
+
+    assert r['created'] == 3
+    assert [result['status'] for result in r['results']] == ['created', 'invalid', 'invalid', 'created', 'created']
+    assert [result['index'] for result in r['results']] == [0, 1, 2, 3, 4]
+    assert r['results'][1]['errors'][0]['loc'] == ['max']
+
+    params = {'slug': beetl['slug'], 'obfuscation': beetl['obfuscation']}
+    r_bids = testclient.get('/bids', params=params).json()
+    assert r_bids['bids_total'] == 3
+    assert sorted(b['id'] for b in r_bids['bids']) == sorted(
+        result['id'] for result in r['results'] if result['status'] == 'created'
+    )
+
+    created = r['results'][0]
+    data = {'id': created['id'], 'secretkey': created['secretkey']}
+    assert testclient.post('/checksecretkey', json=data).json()['status'] == 'success'
+
+def test_post_bids_batch_limit():
+
+    response = testclient.post('/bids/batch', json=[{}] * 1001)
+    assert response.status_code == 422
+
+def test_get_beetl_full_is_beetl_and_bids_in_one():
+
+    for beetlmode in ['public', 'private']:
+        beetl = factory.beetl(beetlmode=beetlmode)
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+        testclient.post('/beetl', json=beetl)
+        full = testclient.get('/beetl/full', params=params)
+        assert full.json()['bids'] == [] and full.json()['bids_total'] == 0
+
+        for _ in range(3):
+            testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug']))
+
+        full = testclient.get('/beetl/full', params=params)
+        assert full.status_code == 200
+        bids = testclient.get('/bids', params=params).json()
+        assert full.json() == {
+            **testclient.get('/beetl', params=params).json(),
+            'bids_total': 3,
+            'bids': bids['bids'],
+        }
+        assert len(full.json()['bids']) == (3 if beetlmode == 'public' else 0)
+
+        etag = full.headers['etag']
+        assert testclient.get('/beetl/full', params=params, headers={'If-None-Match': etag}).status_code == 304
+        testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug']))
+        assert testclient.get('/beetl/full', params=params, headers={'If-None-Match': etag}).status_code == 200
+
+    params = {'obfuscation': 'nope', 'slug': 'nope'}
+    assert testclient.get('/beetl/full', params=params).status_code == 404
+
+def test_bids_need_an_existing_beetl():
+
+    bid = factory.bid('nope', 'nope')
+    assert testclient.post('/bid', json=bid).status_code == 404
+
+    beetl = factory.beetl()
+    testclient.post('/beetl', json=beetl)
+    r = testclient.post('/bids/batch', json=[bid, factory.bid(beetl['obfuscation'], beetl['slug'])]).json()
+    assert r['created'] == 1
+    assert [result['status'] for result in r['results']] == ['invalid', 'created']
+
+def test_bids_for_a_beetl_deleted_elsewhere_are_refused():
+
+    # deleted by another worker, this one still has it cached
+    gone = factory.beetl()
+    testclient.post('/beetl', json=gone)
+    testclient.get('/beetl', params={'obfuscation': gone['obfuscation'], 'slug': gone['slug']})
+    with Session(engine) as session:
+        beetl = session.exec(select(Beetl).where(Beetl.obfuscation == gone['obfuscation'])).one()
+        gone_key = beetl.key
+        session.delete(beetl)
+        session.commit()
+
+    bid = factory.bid(gone['obfuscation'], gone['slug'])
+    assert testclient.post('/bid', json=bid).status_code == 404
+    r = testclient.post('/bids/batch', json=[bid]).json()
+    assert r['created'] == 0
+    assert r['results'][0]['status'] == 'invalid'
+
+    # its key isn't handed out again, nothing of it turns up elsewhere
+    new = factory.beetl(beetlmode='public')
+    testclient.post('/beetl', json=new)
+    with Session(engine) as session:
+        assert session.exec(select(Beetl.key).where(Beetl.obfuscation == new['obfuscation'])).one() > gone_key
+        assert not session.exec(select(Bid).where(Bid.beetl_key == gone_key)).first()
+    assert testclient.get('/bids', params={'obfuscation': new['obfuscation'], 'slug': new['slug']}).json()['bids'] == []
@@ -0,0 +1,84 @@
+from fastapi.testclient import TestClient
+from beetlapi import app, main
+from beetlapi.database.main import Beetl, engine
+from beetlapi.database.writer import GroupCommitWriter
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from test import factory
+import threading
+import uuid
+
+testclient = TestClient(app)
+
+
+def _submit_together(writer, operations):
+
+    results = [None] * len(operations)
+
+    def submit(index, operation):
+        try:
+            results[index] = writer.submit(operation)
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=submit, args=item) for item in enumerate(operations)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_writes_share_a_commit_and_keep_their_own_results():
+
+    writer = GroupCommitWriter(engine, window=0.2)
+    beetls = [Beetl(**factory.beetl()) for _ in range(4)]
+    duplicate = Beetl(**{**beetls[0].dict(), 'id': uuid.uuid4()})
+
+    def add(beetl):
+        def operation(session):
+            session.add(beetl)
+            return beetl.obfuscation
+        return operation
+
+    def fail(session):
+        session.add(Beetl(**factory.beetl()))
+        raise ValueError("nope")
+
+    try:
+        results = _submit_together(writer, [add(beetl) for beetl in beetls] + [add(duplicate), fail])
+    finally:
+        writer.stop()
+
+    assert results[:4] == [beetl.obfuscation for beetl in beetls]
+    assert isinstance(results[4], IntegrityError)
+    assert isinstance(results[5], ValueError)
+    assert writer.operations == 6
+    assert writer.batches < 6
+
+    obfuscations = [beetl.obfuscation for beetl in beetls]
+    with Session(engine) as session:
+        stored = session.exec(select(Beetl).where(Beetl.obfuscation.in_(obfuscations))).all()
+    assert len(stored) == 4
+
+def test_endpoints_write_through_the_writer(monkeypatch):
+
+    writer = GroupCommitWriter(engine, window=0.001)
+    monkeypatch.setattr(main, 'writers', {engine: writer})
+    try:
+        beetl = factory.beetl()
+        secretkey = testclient.post('/beetl', json=beetl).json()['secretkey']
+        assert testclient.post('/beetl', json=beetl).status_code == 409
+
+        bid = testclient.post('/bid', json=factory.bid(beetl['obfuscation'], beetl['slug'])).json()
+        assert testclient.patch('/bid', json={**bid, 'name': 'renamed'}).json()['name'] == 'renamed'
+        assert testclient.patch('/bid', json={**bid, 'secretkey': 'wrong'}).status_code == 404
+
+        params = {'obfuscation': beetl['obfuscation'], 'slug': beetl['slug']}
+        assert testclient.get('/bids', params=params).json()['bids_total'] == 1
+
+        response = testclient.delete('/beetl', params={**params, 'secretkey': secretkey})
+        assert response.json()['bids_deleted'] == 1
+    finally:
+        writer.stop()
+
+    assert writer.operations == 6